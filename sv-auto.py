@@ -9,6 +9,15 @@ import queue
 import datetime
 import random
 import io
+import gc
+import tempfile
+import base64
+import itertools
+import socket
+import struct
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 import ctypes
 from ctypes import wintypes
 from ctypes import windll
@@ -49,7 +58,33 @@ DEFAULT_CONFIG = {
     "server": "国服",  # 默认服务器
     "version": CURRENT_VERSION,  # 当前版本
     "attack_delay": 0.25,  # 新增：攻击延迟默认值
-    "extra_drag_delay": 0.05   # 新增：拖拽操作后的额外延迟
+    "extra_drag_delay": 0.05,   # 新增：拖拽操作后的额外延迟
+    "screen_stream": False,  # 新增：是否使用minicap持续截图流
+    "screen_stream_port": 1313,  # 新增：截图流本地转发端口
+    "capture_backend": "auto",  # 新增：截图后端，auto 为启动时测速自动选择
+    "capture_benchmark_frames": 3,  # 新增：截图后端测速帧数
+    "capture_jpeg_quality": 60,  # 新增：u2_jpeg 截图后端的JPEG质量
+    "template_rois": {},  # 新增：按模板名覆盖搜索区域 [x1, y1, x2, y2]，null 表示全屏
+    "roi_fallback_misses": 5,  # 新增：连续多少次未匹配到任何模板后做一次全屏匹配
+    "roi_full_frame_interval": 30,  # 新增：每隔多少次匹配做一次全屏匹配（不论是否有模板命中），纠正放错的搜索区域，0为不启用
+    "scene_fallback_misses": 3,  # 新增：当前场景的候选模板连续多少次未匹配后改为匹配全部模板
+    "match_workers": 0,  # 新增：模板匹配线程数，0或1为不启用并行匹配
+    "frame_change_threshold": 6,  # 新增：画面变化阈值（缩略图最大像素差），画面未变化时复用上次检测结果，0为不启用
+    "max_reused_sweeps": 5,  # 新增：画面未变化时最多连续复用几次上次的检测结果，之后强制重新匹配
+    "poll_floor": 0.2,  # 新增：最短轮询间隔（秒），操作后和需要快速响应时使用
+    "poll_ceiling": None,  # 新增：最长轮询间隔（秒），为空时使用 scan_interval
+    "poll_backoff": 1.5,  # 新增：空闲时轮询间隔的退避倍数
+    "slot_occupied_threshold": 18,  # 新增：随从位与开局基准的平均灰度差超过该值时认为有随从
+    "evolution_pip_dim_threshold": 25,  # 新增：进化点格子比锁定时亮多少（平均灰度）时认为已点亮，比点亮时暗多少时认为已用掉
+    "input_backend": "u2",  # 新增：触控操作后端，u2 或 minitouch（失败时回退到u2）
+    "touch_stream_port": 1111,  # 新增：minitouch触控通道本地转发端口
+    "fft_matching": False,  # 新增：护盾和费用模板使用批量FFT匹配
+    "fft_cache_mb": 256,  # 新增：批量FFT匹配缓存模板频谱的内存上限（MB）
+    "template_bundle": True,  # 新增：启动时从模板包（内存映射）加载全部模板，模板图片更新后自动重新打包
+    "extra_templates_watch_interval": 2,  # 新增：额外模板目录的检查间隔（秒），运行中增删改的模板自动生效，0为不监视
+    "digit_recognition": False,  # 新增：换牌时用数字识别器识别手牌费用（可在 templates_digits 目录添加6费以上等数字样本）
+    "digit_min_confidence": 0.8,  # 新增：数字识别的最低相似度，低于此值按6费+处理
+    "custom_mulligan_strategies": {}  # 新增：自定义换牌策略，如 {"2费档次": {"keep": [[1, 2, 2, 3]], "fallback": "3费档次"}}
 }
 
 def load_config():
@@ -112,44 +147,908 @@ notification_queue = queue.Queue()
 TEMPLATES_DIR = "templates" # 国服模板目录
 TEMPLATES_DIR_INTERNATIONAL = "templates2"  # 国际服模板目录
 TEMPLATES_DIR_COST = "templates_cost"  # 费用模板目录
+DIGIT_SAMPLES_DIR = "templates_digits"  # 数字样本目录（可选），文件名为 标签_任意.png，如 6_a.png
+
+# 主循环模板清单（720P分辨率）
+# roi: 搜索区域 (x1, y1, x2, y2)，None 表示全屏搜索
+# priority: 匹配优先级，数值越小越先匹配，同一帧中先匹配到的按钮优先处理
+TEMPLATE_MANIFEST = {
+    'dailyCard': {'file': 'dailyCard.png', 'name': "每日卡包", 'threshold': 0.85, 'roi': (160, 0, 1120, 720), 'priority': 10},
+    'missionCompleted': {'file': 'missionCompleted.png', 'name': "任务完成", 'threshold': 0.85, 'roi': (160, 60, 1120, 720), 'priority': 20},
+    'backTitle': {'file': 'backTitle.png', 'name': "返回标题", 'threshold': 0.85, 'roi': (160, 120, 1120, 720), 'priority': 30},
+    'errorBackMain': {'file': 'errorBackMain.png', 'name': "遇到错误，返回主页面", 'threshold': 0.85, 'roi': (160, 120, 1120, 720), 'priority': 40},
+    'error_retry': {'file': 'error_retry.png', 'name': "重试", 'threshold': 0.85, 'roi': (160, 120, 1120, 720), 'priority': 50},
+    'Ok': {'file': 'Ok.png', 'name': "好的", 'threshold': 0.85, 'roi': (160, 120, 1120, 720), 'priority': 60},
+    'decision': {'file': 'decision.png', 'name': "决定", 'threshold': 0.85, 'roi': (320, 400, 960, 720), 'priority': 70},
+    'end_round': {'file': 'end_round.png', 'name': "结束回合", 'threshold': 0.85, 'roi': (1040, 200, 1280, 460), 'priority': 80},
+    'enemy_round': {'file': 'enemy_round.png', 'name': "敌方回合", 'threshold': 0.85, 'roi': (1040, 200, 1280, 460), 'priority': 90},
+    'end': {'file': 'end.png', 'name': "结束", 'threshold': 0.85, 'roi': (160, 300, 1280, 720), 'priority': 100},
+    'war': {'file': 'war.png', 'name': "决斗", 'threshold': 0.85, 'roi': (640, 300, 1280, 720), 'priority': 110},
+    'mainPage': {'file': 'mainPage.png', 'name': "游戏主页面", 'threshold': 0.85, 'roi': None, 'priority': 120},
+    'MuMuPage': {'file': 'MuMuPage.png', 'name': "MuMu主页面", 'threshold': 0.85, 'roi': None, 'priority': 130},
+    'LoginPage': {'file': 'LoginPage.png', 'name': "排队主界面", 'threshold': 0.35, 'roi': None, 'priority': 140},
+    'enterGame': {'file': 'enterGame.png', 'name': "排队进入", 'threshold': 0.85, 'roi': (160, 300, 1120, 720), 'priority': 150},
+    'yes': {'file': 'Yes.png', 'name': "继续中断的对战", 'threshold': 0.85, 'roi': (160, 120, 1120, 720), 'priority': 160},
+    'close1': {'file': 'close1.png', 'name': "关闭卡组预览/编辑", 'threshold': 0.85, 'roi': (640, 0, 1280, 400), 'priority': 170},
+    'close2': {'file': 'close2.png', 'name': "关闭卡组预览/编辑", 'threshold': 0.85, 'roi': (640, 0, 1280, 400), 'priority': 180},
+    'backMain': {'file': 'backMain.png', 'name': "返回主页面", 'threshold': 0.85, 'roi': (160, 120, 1120, 720), 'priority': 190},
+    'rankUp': {'file': 'rankUp.png', 'name': "阶位提升", 'threshold': 0.85, 'roi': (0, 120, 1280, 600), 'priority': 200},
+    'groupUp': {'file': 'groupUp.png', 'name': "分组升级", 'threshold': 0.85, 'roi': (0, 120, 1280, 600), 'priority': 210},
+    'rank': {'file': 'rank.png', 'name': "阶级积分", 'threshold': 0.85, 'roi': None, 'priority': 220},
+}
+
+# 识别到模板后进入的场景
+TEMPLATE_SCENES = {
+    'mainPage': 'lobby',
+    'MuMuPage': 'lobby',
+    'LoginPage': 'lobby',
+    'enterGame': 'lobby',
+    'dailyCard': 'lobby',
+    'close1': 'lobby',
+    'close2': 'lobby',
+    'backMain': 'lobby',
+    'backTitle': 'lobby',
+    'errorBackMain': 'lobby',
+    'war': 'queue',
+    'decision': 'mulligan',
+    'end_round': 'my_turn',
+    'enemy_round': 'enemy_turn',
+    'end': 'result',
+    'rank': 'result',
+    'rankUp': 'result',
+    'groupUp': 'result',
+    'missionCompleted': 'result',
+}
+
+# 各场景下可能出现的模板，None 表示匹配全部模板
+SCENE_CANDIDATES = {
+    'unknown': None,
+    'lobby': None,
+    'result': None,
+    'queue': {'decision', 'war', 'end_round', 'enemy_round', 'enterGame', 'error_retry', 'Ok', 'yes', 'backTitle', 'errorBackMain'},
+    'mulligan': {'decision', 'end_round', 'enemy_round', 'error_retry', 'Ok', 'yes'},
+    'my_turn': {'end_round', 'enemy_round', 'end', 'error_retry', 'Ok', 'yes'},
+    'enemy_turn': {'end_round', 'enemy_round', 'end', 'error_retry', 'Ok', 'yes'},
+}
+
+# 场景名称（日志用）
+SCENE_NAMES = {
+    'unknown': "未知",
+    'lobby': "大厅",
+    'queue': "匹配中",
+    'mulligan': "换牌",
+    'my_turn': "我方回合",
+    'enemy_turn': "敌方回合",
+    'result': "结算",
+}
 
 # 进化按钮模板（全局）
 evolution_template = None
 super_evolution_template = None
 
+# 护盾模板目录
+SHIELD_DIR = "shield"
+
+# 护盾模板库（全局，每次运行只从磁盘加载一次）
+shield_templates = None
+shield_template_names = None  # 与 shield_templates 一一对应的文件名
+
 # 命令队列
 command_queue = queue.Queue()
 
 # 全局设备对象
 device = None
 
-# 随从基准背景色
+# 全局截图流对象（启用持续截图流时使用）
+screen_stream = None
+
+# 全局触控通道对象（使用minitouch操作时使用）
+touch_stream = None
+
+# 全局 uiautomator2 设备对象（截图后端使用）
+u2_client = None
+
+# 当前使用的截图后端名称
+capture_backend = "adb"
+
+# 模板匹配线程池（启用并行匹配时使用）
+match_executor = None
+
+# 批量FFT匹配器（启用批量匹配时使用）
+fft_matcher = None
+
+# 模板包 {(源文件路径, 读取方式): 模板数组}（内存映射）
+template_bundle = {}
+
+# 费用数字识别器（启用数字识别时使用）
+digit_recognizer = None
+
+# 换牌策略表 {策略名: {手牌费用元组: 需要替换的位置元组}}
+mulligan_tables = {}
+
+# u2_jpeg 截图后端的JPEG质量
+capture_jpeg_quality = 60
+
+# 随从基准背景色（第1回合各随从位的灰度截图）
 base_colors = None
 
+# 随从位占用判定阈值
+slot_occupied_threshold = 18
+
+# 进化点/超进化点格子基准亮度（第1回合记录）
+evolution_point_baseline = None
+
+# 进化点格子变暗判定阈值
+evolution_pip_dim_threshold = 25
+
 # 是否在对战中
 in_match = False
 
 # UI日志信号
 ui_log_signal = pyqtSignal(str)
 
+# ================== 截图流 ==================
+class ScreenStream:
+    """
+    minicap 协议的持续截图流
+    后台线程持续接收设备推送的JPEG帧，只保留最新一帧，读取时无需等待设备截图
+    """
+
+    def __init__(self, host="127.0.0.1", port=1313, timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.banner = {}
+        self._sock = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._first_frame = threading.Event()
+        self._running = False
+        self._latest = None  # 最新一帧的原始JPEG数据
+        self._frame_id = 0
+        self._decoded = None  # (帧序号, 解码后的BGR图像) 缓存
+        self.frame_count = 0
+
+    def start(self):
+        """连接截图流并启动接收线程"""
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._read_banner()
+        self._sock.settimeout(None)
+        self._running = True
+        self._thread = threading.Thread(target=self._receive_loop, name="ScreenStream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止接收并关闭连接"""
+        self._running = False
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+        self._sock = None
+        self._thread = None
+
+    @property
+    def alive(self):
+        """接收线程是否仍在运行"""
+        return self._running and self._thread is not None and self._thread.is_alive()
+
+    def _read_exact(self, size):
+        """从socket读取指定长度的数据"""
+        buf = bytearray(size)
+        view = memoryview(buf)
+        received = 0
+        while received < size:
+            n = self._sock.recv_into(view[received:], size - received)
+            if n == 0:
+                raise ConnectionError("截图流连接已关闭")
+            received += n
+        return buf
+
+    def _read_banner(self):
+        """读取minicap头部信息"""
+        head = self._read_exact(2)
+        version, length = head[0], head[1]
+        rest = self._read_exact(length - 2)
+        pid, real_w, real_h, virtual_w, virtual_h, orientation, quirks = struct.unpack_from("<IIIIIBB", rest)
+        self.banner = {
+            'version': version,
+            'pid': pid,
+            'real_width': real_w,
+            'real_height': real_h,
+            'virtual_width': virtual_w,
+            'virtual_height': virtual_h,
+            'orientation': orientation * 90,
+            'quirks': quirks,
+        }
+
+    def _receive_loop(self):
+        """持续接收帧，只保留最新一帧"""
+        try:
+            while self._running:
+                (size,) = struct.unpack("<I", self._read_exact(4))
+                frame = self._read_exact(size)
+                with self._lock:
+                    self._latest = frame
+                    self._frame_id += 1
+                    self.frame_count += 1
+                self._first_frame.set()
+        except (OSError, ConnectionError, struct.error) as e:
+            if self._running:
+                logger.warning(f"截图流中断: {str(e)}")
+        finally:
+            self._running = False
+
+    def read_raw(self, timeout=2):
+        """返回 (帧序号, 最新一帧JPEG数据)，尚未收到任何帧时等待"""
+        if not self._first_frame.wait(timeout):
+            return 0, None
+        with self._lock:
+            return self._frame_id, self._latest
+
+    def read(self, timeout=2):
+        """返回最新一帧的BGR图像，同一帧只解码一次"""
+        frame_id, data = self.read_raw(timeout)
+        if data is None:
+            return None
+
+        cached = self._decoded
+        if cached is not None and cached[0] == frame_id:
+            return cached[1]
+
+        # 直接在接收缓冲区上解码，不经过PIL
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        self._decoded = (frame_id, image)
+        return image
+
+def start_screen_stream(adb_device, port):
+    """
+    在设备上启动minicap并建立持续截图流
+    需要预先将与设备ABI匹配的minicap和minicap.so推送到 /data/local/tmp
+    :return: 截图流对象，失败时返回None
+    """
+    try:
+        w, h = adb_device.window_size()
+        rotation = adb_device.rotation() * 90
+        # minicap 使用设备自然方向的尺寸
+        if rotation in (90, 270):
+            w, h = h, w
+        adb_device.forward(f"tcp:{port}", "localabstract:minicap")
+        # 保持shell连接，minicap进程随连接存活
+        process = adb_device.shell(
+            f"LD_LIBRARY_PATH=/data/local/tmp /data/local/tmp/minicap -P {w}x{h}@{w}x{h}/{rotation}",
+            stream=True
+        )
+    except Exception as e:
+        logger.error(f"启动minicap失败: {str(e)}")
+        return None
+
+    # 等待minicap就绪
+    for _ in range(10):
+        stream = ScreenStream(port=port)
+        try:
+            stream.start()
+            stream.process = process
+            if stream.read_raw(timeout=2)[1] is not None:
+                logger.info(f"截图流已启动: {stream.banner['virtual_width']}x{stream.banner['virtual_height']}")
+                return stream
+            stream.stop()
+        except (OSError, ConnectionError, struct.error):
+            stream.stop()
+        time.sleep(0.5)
+
+    logger.error("截图流未能连接，继续使用普通截图")
+    try:
+        process.close()
+    except Exception:
+        pass
+    return None
+
+def stop_screen_stream():
+    """关闭全局截图流"""
+    global screen_stream
+
+    if screen_stream is None:
+        return
+    screen_stream.stop()
+    process = getattr(screen_stream, 'process', None)
+    if process is not None:
+        try:
+            process.close()
+        except Exception:
+            pass
+    screen_stream = None
+
+# ================== 触控通道 ==================
+class TouchStream:
+    """
+    minitouch 协议的持续触控通道
+    保持一个socket连接，以 d/m/u/c/w 命令流发送触控事件，不需要等待设备逐条响应
+    """
+
+    def __init__(self, host="127.0.0.1", port=1111, timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.banner = {}
+        self._sock = None
+        self._lock = threading.Lock()
+        self.command_count = 0
+
+    def start(self):
+        """连接触控通道并读取头部信息"""
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._read_banner()
+
+    def stop(self):
+        """关闭连接"""
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+
+    @property
+    def alive(self):
+        """连接是否可用"""
+        return self._sock is not None
+
+    def _read_banner(self):
+        """读取minitouch头部信息（v 版本、^ 触点数和坐标范围、$ 进程号）"""
+        reader = self._sock.makefile('rb')
+        try:
+            while True:
+                line = reader.readline()
+                if not line:
+                    raise ConnectionError("触控通道连接已关闭")
+                fields = line.decode('ascii', 'ignore').split()
+                if not fields:
+                    continue
+                if fields[0] == 'v':
+                    self.banner['version'] = int(fields[1])
+                elif fields[0] == '^':
+                    self.banner['max_contacts'] = int(fields[1])
+                    self.banner['max_x'] = int(fields[2])
+                    self.banner['max_y'] = int(fields[3])
+                    self.banner['max_pressure'] = int(fields[4])
+                elif fields[0] == '$':
+                    self.banner['pid'] = int(fields[1])
+                    break
+        finally:
+            reader.close()
+
+    def send(self, commands):
+        """一次写入一组命令（每条命令一行）"""
+        if self._sock is None:
+            raise ConnectionError("触控通道未连接")
+        with self._lock:
+            self._sock.sendall("".join(commands).encode('ascii'))
+            self.command_count += len(commands)
+
+class MinitouchDevice:
+    """
+    通过 minitouch 触控通道操作的设备对象
+    提供与 uiautomator2 设备相同的 click、swipe、swipe_points 接口以及整批提交的 submit_gestures，
+    其余属性和方法以及触控通道断开后的操作都交给 uiautomator2 设备
+    """
+
+    # 点击时按下的持续时间（秒）
+    TAP_TIME = 0.02
+
+    def __init__(self, u2_device, touch_stream, screen_size=(1280, 720), rotation=0):
+        self.u2_device = u2_device
+        self.touch_stream = touch_stream
+        self.width, self.height = screen_size
+        self.rotation = rotation
+        self.pressure = max(1, touch_stream.banner.get('max_pressure', 50) // 2)
+        # 坐标范围在连接时确定，触控通道断开后换算坐标时不再访问通道
+        self.max_x = touch_stream.banner.get('max_x', self.width)
+        self.max_y = touch_stream.banner.get('max_y', self.height)
+
+    def __getattr__(self, name):
+        return getattr(self.u2_device, name)
+
+    def _point(self, x, y):
+        """屏幕坐标换算为触控设备坐标（触控设备使用自然方向）"""
+        rx, ry = x / self.width, y / self.height
+        if self.rotation == 90:
+            rx, ry = 1 - ry, rx
+        elif self.rotation == 180:
+            rx, ry = 1 - rx, 1 - ry
+        elif self.rotation == 270:
+            rx, ry = ry, 1 - rx
+        return int(rx * self.max_x), int(ry * self.max_y)
+
+    def _path_commands(self, points, segment):
+        """按下、逐点移动、抬起的命令，segment 为相邻两点之间的时间（秒）"""
+        wait = f"w {max(1, int(segment * 1000))}\n"
+        x, y = self._point(*points[0])
+        commands = [f"d 0 {x} {y} {self.pressure}\n", "c\n"]
+        for point in points[1:]:
+            x, y = self._point(*point)
+            commands += [wait, f"m 0 {x} {y} {self.pressure}\n", "c\n"]
+        commands += ["u 0\n", "c\n"]
+        return commands
+
+    def _send(self, commands, seconds):
+        """发送命令并等待手势在设备端执行完，触控通道不可用时返回False"""
+        if self.touch_stream is None:
+            return False
+        try:
+            self.touch_stream.send(commands)
+        except (OSError, ConnectionError) as e:
+            logger.warning(f"触控通道中断: {str(e)}，改用uiautomator2操作")
+            self.touch_stream.stop()
+            self.touch_stream = None
+            return False
+        time.sleep(seconds)
+        return True
+
+    def click(self, x, y):
+        x1, y1 = self._point(x, y)
+        commands = [f"d 0 {x1} {y1} {self.pressure}\n", "c\n",
+                    f"w {int(self.TAP_TIME * 1000)}\n", "u 0\n", "c\n"]
+        if not self._send(commands, self.TAP_TIME):
+            self.u2_device.click(x, y)
+
+    def swipe_points(self, points, duration=0.5):
+        """与 uiautomator2 相同：duration 为相邻两点之间的时间"""
+        if not self._send(self._path_commands(points, duration), duration * (len(points) - 1)):
+            self.u2_device.swipe_points(points, duration)
+
+    def swipe(self, fx, fy, tx, ty, duration=0.1, steps=None):
+        steps = max(1, int(duration / 0.02))
+        points = [(fx + (tx - fx) * i / steps, fy + (ty - fy) * i / steps) for i in range(steps + 1)]
+        if not self._send(self._path_commands(points, duration / steps), duration):
+            self.u2_device.swipe(fx, fy, tx, ty, duration=duration)
+
+    def submit_gestures(self, gestures):
+        """整批手势一次写入，手势之间的等待也由设备端执行"""
+        commands = []
+        seconds = 0
+        for points, segment, pause in gestures:
+            commands += self._path_commands(points, segment)
+            seconds += segment * (len(points) - 1)
+            if pause > 0:
+                commands.append(f"w {int(pause * 1000)}\n")
+                seconds += pause
+        if not self._send(commands, seconds):
+            for points, segment, pause in gestures:
+                self.u2_device.swipe_points(points, segment)
+                if pause > 0:
+                    time.sleep(pause)
+
+def start_touch_stream(adb_device, port):
+    """
+    在设备上启动minitouch并建立触控通道
+    需要预先将与设备ABI匹配的minitouch推送到 /data/local/tmp
+    :return: 触控通道对象，失败时返回None
+    """
+    try:
+        adb_device.forward(f"tcp:{port}", "localabstract:minitouch")
+        # 保持shell连接，minitouch进程随连接存活
+        process = adb_device.shell("/data/local/tmp/minitouch", stream=True)
+    except Exception as e:
+        logger.error(f"启动minitouch失败: {str(e)}")
+        return None
+
+    # 等待minitouch就绪
+    for _ in range(10):
+        stream = TouchStream(port=port)
+        try:
+            stream.start()
+            stream.process = process
+            logger.info(f"触控通道已启动: {stream.banner.get('max_x')}x{stream.banner.get('max_y')}")
+            return stream
+        except (OSError, ConnectionError, ValueError, IndexError):
+            stream.stop()
+        time.sleep(0.5)
+
+    logger.error("触控通道未能连接，继续使用uiautomator2操作")
+    try:
+        process.close()
+    except Exception:
+        pass
+    return None
+
+def stop_touch_stream():
+    """关闭全局触控通道"""
+    global touch_stream
+
+    if touch_stream is None:
+        return
+    touch_stream.stop()
+    process = getattr(touch_stream, 'process', None)
+    if process is not None:
+        try:
+            process.close()
+        except Exception:
+            pass
+    touch_stream = None
+
+# ================== 截图后端 ==================
+# 截图后端统一返回 (像素数组, 通道顺序)，由 FrameContext 按需转换为BGR和灰度图
+def capture_adb():
+    """adbutils 截图（screencap -p，PNG编码传输）"""
+    return np.asarray(device.screenshot()), 'RGB'
+
+def capture_raw():
+    """exec-out screencap 原始RGBA数据，省去设备端PNG编码"""
+    conn = device.open_transport()
+    try:
+        conn.send_command("exec:screencap")
+        conn.check_okay()
+        chunks = []
+        while True:
+            chunk = conn.conn.recv(1 << 20)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        conn.close()
+
+    data = b"".join(chunks)
+    if len(data) < 12:
+        return None
+    w, h = struct.unpack_from("<II", data)
+    # Android 12 以上的头部多出4字节色彩空间字段，按实际长度推算
+    header_size = len(data) - w * h * 4
+    if header_size not in (12, 16):
+        return None
+    # 直接作为接收缓冲区上的视图，不做拷贝
+    pixels = np.frombuffer(data, dtype=np.uint8, count=w * h * 4, offset=header_size).reshape(h, w, 4)
+    return pixels, 'RGBA'
+
+def capture_u2():
+    """uiautomator2 截图"""
+    if u2_client is None:
+        return None
+    return u2_client.screenshot(format='opencv'), 'BGR'
+
+def capture_u2_jpeg():
+    """uiautomator2 低质量JPEG截图，传输数据量最小"""
+    if u2_client is None:
+        return None
+    data = base64.b64decode(u2_client.jsonrpc.takeScreenshot(1, capture_jpeg_quality))
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR), 'BGR'
+
+def capture_stream():
+    """读取持续截图流的最新一帧"""
+    if screen_stream is None:
+        return None
+    if not screen_stream.alive:
+        logger.warning("截图流不可用，改用其他截图方式")
+        stop_screen_stream()
+        return None
+    image = screen_stream.read()
+    if image is None:
+        return None
+    return image, 'BGR'
+
+# 截图后端注册表（名称 -> 截图函数）
+CAPTURE_BACKENDS = {
+    'stream': capture_stream,
+    'raw': capture_raw,
+    'u2_jpeg': capture_u2_jpeg,
+    'u2': capture_u2,
+    'adb': capture_adb,
+}
+
+def _capture_difference(raw, reference):
+    """计算两张截图缩略图的平均差异，用于校验截图后端输出是否正确"""
+    if raw is None or reference is None or raw[0] is None:
+        return None
+    if raw[0].shape[:2] != reference[0].shape[:2]:
+        return None
+    thumb = FrameContext(*raw).downscaled()
+    ref_thumb = FrameContext(*reference).downscaled()
+    return float(np.mean(cv2.absdiff(thumb, ref_thumb)))
+
+def benchmark_capture_backends(frames=3, max_difference=40):
+    """
+    依次测试各截图后端的单帧耗时
+    以adb截图为参考，尺寸不同或画面差异过大的后端视为输出不正确
+    :return: {后端名称: 平均单帧耗时(秒)}
+    """
+    try:
+        reference = capture_adb()
+    except Exception as e:
+        logger.error(f"参考截图失败: {str(e)}")
+        return {}
+
+    results = {}
+    for name, backend in CAPTURE_BACKENDS.items():
+        try:
+            # 预热一次并校验输出
+            diff = _capture_difference(backend(), reference)
+            if diff is None or diff > max_difference:
+                logger.info(f"截图后端 {name} 不可用或输出不正确，跳过")
+                continue
+
+            start = time.perf_counter()
+            for _ in range(frames):
+                if backend() is None:
+                    raise RuntimeError("截图为空")
+            results[name] = (time.perf_counter() - start) / frames
+        except Exception as e:
+            logger.info(f"截图后端 {name} 测试失败: {str(e)}")
+    return results
+
+def select_capture_backend(name="auto", frames=3):
+    """
+    设置全局截图后端，auto 时测速选择最快的正确后端
+    :return: (后端名称, 各后端单帧耗时)
+    """
+    global capture_backend
+
+    if name != "auto":
+        if name in CAPTURE_BACKENDS:
+            capture_backend = name
+        else:
+            logger.warning(f"未知截图后端: {name}，使用adb")
+            capture_backend = "adb"
+        return capture_backend, {}
+
+    results = benchmark_capture_backends(frames)
+    capture_backend = min(results, key=results.get) if results else "adb"
+    return capture_backend, results
+
+# ================== 帧解码 ==================
+# 通道顺序 -> (转BGR的转换码, 转灰度的转换码)，BGR无需转换
+FRAME_CONVERSIONS = {
+    'RGB': (cv2.COLOR_RGB2BGR, cv2.COLOR_RGB2GRAY),
+    'RGBA': (cv2.COLOR_RGBA2BGR, cv2.COLOR_RGBA2GRAY),
+    'BGR': (None, cv2.COLOR_BGR2GRAY),
+}
+
+class FrameContext:
+    """
+    单帧截图上下文
+    每次截图创建一次，灰度图、BGR图、缩略图、区域裁剪和直方图均衡等派生图像按需计算并缓存，
+    同一帧无论经过多少个检测函数都只转换一次
+    """
+
+    # 空闲的帧缓冲区 {(名称, 尺寸): [缓冲区, ...]}
+    # 派生图像计算时从这里取出缓冲区，归取出它的帧所有；帧被释放时才放回，帧的派生图像不会被之后的帧覆盖
+    _buffer_pool = {}
+    _pool_lock = threading.Lock()
+    MAX_POOLED_BUFFERS = 4
+
+    def __init__(self, pixels, channel_order='BGR'):
+        self.pixels = pixels
+        self.channel_order = channel_order
+        self.height, self.width = pixels.shape[:2]
+        self.timestamp = time.time()
+        self._cache = {}
+        self._owned = []  # 本帧从缓冲池取出的缓冲区 [(名称, 尺寸, 缓冲区)]
+
+    def _take_buffer(self, name, shape):
+        """从缓冲池取出一个空闲缓冲区（没有时新分配），帧被释放时放回缓冲池"""
+        with FrameContext._pool_lock:
+            pool = FrameContext._buffer_pool.get((name, shape))
+            buf = pool.pop() if pool else None
+        if buf is None:
+            buf = np.empty(shape, dtype=np.uint8)
+        if not self._owned:
+            # 回调只引用缓冲区列表，不引用帧本身
+            weakref.finalize(self, FrameContext._return_buffers, self._owned)
+        self._owned.append((name, shape, buf))
+        return buf
+
+    @staticmethod
+    def _return_buffers(owned):
+        """帧被释放后把它的缓冲区放回缓冲池（每种缓冲区最多保留 MAX_POOLED_BUFFERS 个）"""
+        with FrameContext._pool_lock:
+            for name, shape, buf in owned:
+                pool = FrameContext._buffer_pool.setdefault((name, shape), [])
+                if len(pool) < FrameContext.MAX_POOLED_BUFFERS:
+                    pool.append(buf)
+        owned.clear()
+
+    @property
+    def bgr(self):
+        """BGR图（原始像素已是BGR时不做转换）"""
+        if 'bgr' not in self._cache:
+            code = FRAME_CONVERSIONS[self.channel_order][0]
+            if code is None:
+                self._cache['bgr'] = self.pixels
+            else:
+                dst = self._take_buffer('bgr', (self.height, self.width, 3))
+                self._cache['bgr'] = cv2.cvtColor(self.pixels, code, dst=dst)
+        return self._cache['bgr']
+
+    @property
+    def gray(self):
+        """灰度图（直接由原始像素转换，不经过BGR）"""
+        if 'gray' not in self._cache:
+            code = FRAME_CONVERSIONS[self.channel_order][1]
+            dst = self._take_buffer('gray', (self.height, self.width))
+            self._cache['gray'] = cv2.cvtColor(self.pixels, code, dst=dst)
+        return self._cache['gray']
+
+    def downscaled(self, size=(64, 36)):
+        """缩小后的灰度图"""
+        key = ('downscaled', size)
+        if key not in self._cache:
+            self._cache[key] = cv2.resize(self.gray, size, interpolation=cv2.INTER_AREA)
+        return self._cache[key]
+
+    def crop_gray(self, region):
+        """灰度图的矩形区域 (x1, y1, x2, y2)"""
+        key = ('gray', region)
+        if key not in self._cache:
+            x1, y1, x2, y2 = region
+            self._cache[key] = self.gray[y1:y2, x1:x2]
+        return self._cache[key]
+
+    def crop_bgr(self, region):
+        """BGR图的矩形区域 (x1, y1, x2, y2)"""
+        key = ('bgr', region)
+        if key not in self._cache:
+            x1, y1, x2, y2 = region
+            self._cache[key] = self.bgr[y1:y2, x1:x2]
+        return self._cache[key]
+
+    def equalized(self, region):
+        """灰度区域的直方图均衡结果"""
+        key = ('equalized', region)
+        if key not in self._cache:
+            self._cache[key] = cv2.equalizeHist(self.crop_gray(region))
+        return self._cache[key]
+
 # ================== 核心功能函数 ==================
 def take_screenshot():
-    """获取设备截图 - 使用全局设备对象"""
+    """
+    获取设备截图 - 使用当前选择的截图后端，失败时回退到adb截图
+    :return: FrameContext，派生图像按需计算，帧被释放后其缓冲区才会被之后的截图复用（派生图像和裁剪只在帧存活期间有效）
+    """
     global device  # 使用全局设备对象
 
     if device is None:
         logger.error("设备未初始化")
         return None
 
+    raw = None
+    if capture_backend != "adb":
+        try:
+            raw = CAPTURE_BACKENDS[capture_backend]()
+        except Exception as e:
+            logger.warning(f"截图后端 {capture_backend} 截图失败: {str(e)}，改用adb截图")
+
+    if raw is None:
+        try:
+            raw = capture_adb()
+        except Exception as e:
+            logger.error(f"截图失败: {str(e)}")
+            return None
+
+    pixels, channel_order = raw
+    return FrameContext(pixels, channel_order)
+
+# ================== 模板包 ==================
+# 模板包文件格式：魔数 + 版本号 + 头部长度 + JSON头部（各模板的源文件、修改时间、读取方式、偏移和尺寸）+ 连续的像素数据
+TEMPLATE_BUNDLE_MAGIC = b"SVTB"
+TEMPLATE_BUNDLE_VERSION = 1
+TEMPLATE_BUNDLE_ALIGN = 64
+
+def _template_bundle_sources(directories):
+    """列出模板包包含的源文件 [(路径, 读取方式)]，读取方式为 gray 或 color"""
+    sources = []
+    for directory, mode in directories:
+        if not directory or not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
+                sources.append((os.path.normpath(os.path.join(directory, filename)), mode))
+    return sources
+
+def _read_template_bundle_header(path):
+    """读取模板包头部，格式或版本不符时返回None"""
+    with open(path, 'rb') as f:
+        magic, version, header_size = struct.unpack("<4sII", f.read(12))
+        if magic != TEMPLATE_BUNDLE_MAGIC or version != TEMPLATE_BUNDLE_VERSION:
+            return None
+        header = json.loads(f.read(header_size).decode('utf-8'))
+    header['data_offset'] = -(-(12 + header_size) // TEMPLATE_BUNDLE_ALIGN) * TEMPLATE_BUNDLE_ALIGN
+    return header
+
+def _template_bundle_stale(header, sources):
+    """源文件列表变化或任一源文件的修改时间与打包时不同时需要重新打包"""
+    if header is None:
+        return True
+    packed = {(entry['path'], entry['mode']): entry['mtime'] for entry in header['entries']}
+    if set(packed) != set(sources):
+        return True
+    return any(os.path.getmtime(path) != packed[(path, mode)] for path, mode in sources)
+
+def build_template_bundle(path, sources):
+    """
+    把所有源文件解码后写入模板包
+    先写入同目录下的唯一临时文件再替换，多个实例同时重新打包时互不干扰
+    """
+    entries, blobs, offset = [], [], 0
+    for source, mode in sources:
+        flag = cv2.IMREAD_GRAYSCALE if mode == 'gray' else cv2.IMREAD_COLOR
+        image = cv2.imread(source, flag)
+        if image is None:
+            logger.warning(f"无法加载模板: {source}")
+            continue
+        data = np.ascontiguousarray(image).tobytes()
+        entries.append({
+            'path': source,
+            'mode': mode,
+            'mtime': os.path.getmtime(source),
+            'offset': offset,
+            'shape': list(image.shape)
+        })
+        padding = -len(data) % TEMPLATE_BUNDLE_ALIGN
+        blobs.append(data + b"\0" * padding)
+        offset += len(data) + padding
+
+    header = json.dumps({'entries': entries}, ensure_ascii=False).encode('utf-8')
+    prefix = struct.pack("<4sII", TEMPLATE_BUNDLE_MAGIC, TEMPLATE_BUNDLE_VERSION, len(header)) + header
+    prefix += b"\0" * (-len(prefix) % TEMPLATE_BUNDLE_ALIGN)
+
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                     dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(prefix)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return len(entries)
+
+def load_template_bundle(path, directories):
+    """
+    加载模板包（内存映射，多个进程共享同一份页面），源文件有更新时先重新打包
+    :param directories: [(目录, 读取方式)]
+    :return: {(源文件路径, 读取方式): 只读模板数组}，失败时返回空字典（改为逐个读取图片）
+    """
+    sources = _template_bundle_sources(directories)
     try:
-        return device.screenshot()
+        header = _read_template_bundle_header(path) if os.path.exists(path) else None
+        if _template_bundle_stale(header, sources):
+            # 释放本进程中已不再使用的旧内存映射，否则Windows上无法替换文件
+            gc.collect()
+            try:
+                count = build_template_bundle(path, sources)
+            except PermissionError as e:
+                logger.warning(f"模板包 {path} 正在被其他运行中的实例使用，无法替换为新模板包: {str(e)}，"
+                               f"本次改为逐个读取模板图片（关闭其他实例后重新启动即可更新）")
+                return {}
+            logger.info(f"模板包已重新生成: {path}（{count} 个模板）")
+            header = _read_template_bundle_header(path)
+
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        bundle = {}
+        for entry in header['entries']:
+            start = header['data_offset'] + entry['offset']
+            size = int(np.prod(entry['shape']))
+            bundle[(entry['path'], entry['mode'])] = data[start:start + size].reshape(entry['shape'])
+        return bundle
     except Exception as e:
-        logger.error(f"截图失败: {str(e)}")
-        return None
+        logger.warning(f"加载模板包失败: {str(e)}，改为逐个读取模板图片")
+        return {}
 
 def load_template(templates_dir, filename):
-    """加载模板图像并返回灰度图"""
+    """加载模板图像并返回灰度图（已加载模板包时直接取模板包中的数据）"""
     path = os.path.join(templates_dir, filename)
+    bundled = template_bundle.get((os.path.normpath(path), 'gray'))
+    if bundled is not None:
+        return bundled
+
     if not os.path.exists(path):
         logger.error(f"模板文件不存在: {path}")
         return None
@@ -159,8 +1058,8 @@ def load_template(templates_dir, filename):
         logger.error(f"无法加载模板: {path}")
     return template
 
-def create_template_info(template, name, threshold=0.85):
-    """创建模板信息字典"""
+def create_template_info(template, name, threshold=0.85, roi=None):
+    """创建模板信息字典，roi 为搜索区域 (x1, y1, x2, y2)，None 表示全屏"""
     if template is None:
         return None
 
@@ -170,87 +1069,635 @@ def create_template_info(template, name, threshold=0.85):
         'template': template,
         'w': w,
         'h': h,
-        'threshold': threshold
+        'threshold': threshold,
+        'roi': tuple(roi) if roi else None
     }
 
-def match_template(gray_image, template_info):
-    """执行模板匹配并返回结果"""
+def load_main_templates(templates_dir, roi_overrides=None):
+    """按模板清单的优先级加载主循环模板，roi_overrides 可按模板名覆盖搜索区域"""
+    roi_overrides = roi_overrides or {}
+    templates = {}
+    for key, entry in sorted(TEMPLATE_MANIFEST.items(), key=lambda item: item[1]['priority']):
+        templates[key] = create_template_info(
+            load_template(templates_dir, entry['file']),
+            entry['name'],
+            threshold=entry['threshold'],
+            roi=roi_overrides.get(key, entry['roi'])
+        )
+    return templates
+
+def _clip_roi(roi, template_info, height, width):
+    """把搜索区域限制在画面内，区域放不下模板时返回None（改为全屏搜索）"""
+    x1, y1, x2, y2 = roi
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(width, x2), min(height, y2)
+    if x2 - x1 < template_info['w'] or y2 - y1 < template_info['h']:
+        return None
+    return x1, y1, x2, y2
+
+def match_template(image, template_info, full_frame=False, roi=None):
+    """
+    执行模板匹配并返回结果，image 为 FrameContext 或灰度图
+    模板带有搜索区域时只在区域内匹配，返回的坐标已换算回全屏坐标
+    :param full_frame: 忽略搜索区域，强制全屏匹配
+    :param roi: 本次匹配使用的搜索区域，不传时使用模板自带的搜索区域
+    """
     if not template_info:
         return None, 0
 
+    gray_image = image.gray if isinstance(image, FrameContext) else image
+    offset_x, offset_y = 0, 0
+
+    roi = roi or template_info.get('roi')
+    if roi and not full_frame:
+        roi = _clip_roi(roi, template_info, gray_image.shape[0], gray_image.shape[1])
+        if roi:
+            offset_x, offset_y = roi[0], roi[1]
+            if isinstance(image, FrameContext):
+                gray_image = image.crop_gray(roi)
+            else:
+                gray_image = gray_image[roi[1]:roi[3], roi[0]:roi[2]]
+
     result = cv2.matchTemplate(gray_image, template_info['template'], cv2.TM_CCOEFF_NORMED)
     _, max_val, _, max_loc = cv2.minMaxLoc(result)
-    return max_loc, max_val
+    return (max_loc[0] + offset_x, max_loc[1] + offset_y), max_val
 
-def scan_shield_targets():
-    """扫描指定矩形区域(247,151)-(1028,312)内的护盾随从（彩色匹配），最多返回一个置信度最高的目标"""
-    shield_dir = "shield"
-    shield_targets = []  # 存储所有检测到的护盾目标及其置信度
+def start_match_executor(workers):
+    """按配置启动模板匹配线程池，workers 不大于1时不启用"""
+    global match_executor
 
-    # 确保shield目录存在
-    if not os.path.exists(shield_dir) or not os.path.isdir(shield_dir):
-        return []
+    stop_match_executor()
+    if workers and workers > 1:
+        match_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="TemplateMatch")
+    return match_executor
+
+def stop_match_executor():
+    """关闭模板匹配线程池"""
+    global match_executor
 
-    screenshot_shield = take_screenshot()
-    if screenshot_shield is None:
+    if match_executor is not None:
+        match_executor.shutdown(wait=False)
+        match_executor = None
+
+def match_templates(image, items, full_frame=False):
+    """
+    批量匹配模板，按 items 的顺序逐个产出 (键, 模板信息, 坐标, 匹配度)
+    启用线程池时所有模板同时匹配（cv2.matchTemplate 会释放GIL），结果仍按原顺序产出，
+    未启用时逐个匹配，调用方提前结束遍历时不再匹配剩余模板
+    :param items: [(键, 模板信息), ...]，模板信息为空的项会被跳过
+    """
+    if match_executor is None:
+        for key, template_info in items:
+            if not template_info:
+                continue
+            max_loc, max_val = match_template(image, template_info, full_frame)
+            yield key, template_info, max_loc, max_val
+        return
+
+    # 先在当前线程生成灰度图，避免多个线程同时写入帧缓存
+    if isinstance(image, FrameContext):
+        image.gray
+
+    futures = [
+        (key, template_info, match_executor.submit(match_template, image, template_info, full_frame))
+        for key, template_info in items if template_info
+    ]
+    try:
+        for key, template_info, future in futures:
+            max_loc, max_val = future.result()
+            yield key, template_info, max_loc, max_val
+    finally:
+        # 调用方提前结束时取消尚未开始的匹配
+        for _, _, future in futures:
+            future.cancel()
+
+def record_hits(matches, hits):
+    """透传匹配结果，同时把达到阈值的结果记录到 hits 列表中（供画面未变化时复用）"""
+    for match in matches:
+        if match[3] >= match[1]['threshold']:
+            hits.append(match)
+        yield match
+
+def rematch_hits(image, hits):
+    """
+    画面与上次匹配时基本相同时使用：上次没有命中时沿用“没有命中”的结论；
+    上次有命中时不复用旧坐标，只重新匹配这几个模板，点击位置取自本帧
+    :return: 匹配结果列表，上次命中的模板都不再命中时返回None（需要完整匹配）
+    """
+    if not hits:
         return []
+    matches = list(match_templates(image, [(key, template_info) for key, template_info, _, _ in hits]))
+    if any(max_val >= template_info['threshold'] for _, template_info, _, max_val in matches):
+        return matches
+    return None
+
+def expand_template_roi(template_info, max_loc, margin=40):
+    """
+    全屏匹配时在搜索区域外找到模板，扩展搜索区域把该位置包含进来
+    :return: 是否扩展了搜索区域
+    """
+    roi = template_info.get('roi')
+    if not roi:
+        return False
+
+    x1, y1, x2, y2 = roi
+    hit_x1, hit_y1 = max_loc
+    hit_x2, hit_y2 = hit_x1 + template_info['w'], hit_y1 + template_info['h']
+    if x1 <= hit_x1 and y1 <= hit_y1 and hit_x2 <= x2 and hit_y2 <= y2:
+        return False
+
+    template_info['roi'] = (
+        max(0, min(x1, hit_x1 - margin)),
+        max(0, min(y1, hit_y1 - margin)),
+        max(x2, hit_x2 + margin),
+        max(y2, hit_y2 + margin),
+    )
+    return True
+
+# ================== 批量FFT匹配 ==================
+class FFTMatcher:
+    """
+    批量模板匹配（TM_CCOEFF_NORMED）
+    一组模板补零到ROI大小后，在频域与同一块ROI一次完成所有模板的相关运算（批量逆变换），
+    分母由积分图计算，结果与 cv2.matchTemplate 在浮点误差范围内一致。
+    变换尺寸按 SIZE_STEP 向上取整后取 cv2.getOptimalDFTSize，大小不一的ROI共用少数几种尺寸；
+    模板的频谱按 (模板名, 变换尺寸) 缓存，总大小超过 cache_mb 后不再缓存
+    """
 
-    # 将PIL截图转为OpenCV格式
-    screenshot_np = np.array(screenshot_shield)
-    screenshot_cv = cv2.cvtColor(screenshot_np, cv2.COLOR_RGB2BGR)  # RGB转BGR格式
+    SIZE_STEP = 32
+
+    def __init__(self, group_size=16, cache_mb=256):
+        self.group_size = group_size
+        self.cache_bytes = cache_mb * 1024 * 1024
+        self._cache = {}  # (模板名, 变换尺寸) -> (模板, 频谱, 去均值后的平方和)
+        self._cached_bytes = 0
+
+    def clear(self):
+        """清空频谱缓存（模板重新加载后调用）"""
+        self._cache = {}
+        self._cached_bytes = 0
+
+    @classmethod
+    def _padded_shape(cls, shape):
+        """ROI尺寸对应的变换尺寸"""
+        return tuple(cv2.getOptimalDFTSize(-(-n // cls.SIZE_STEP) * cls.SIZE_STEP) for n in shape)
+
+    @staticmethod
+    def _channels(image):
+        """统一为 (通道, 高, 宽) 的float32数组"""
+        image = np.asarray(image, dtype=np.float32)
+        if image.ndim == 2:
+            return image[None]
+        return image.transpose(2, 0, 1)
+
+    def _spectrum(self, template, shape, name=None):
+        """
+        模板（各通道去均值后补零到变换尺寸）的频谱及平方和
+        :param name: 模板名，不传时按模板对象缓存；缓存中保留模板引用，同名模板被替换后重新计算
+        """
+        key = (id(template) if name is None else name, shape)
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[0] is template:
+                return cached[1], cached[2]
+            del self._cache[key]
+            self._cached_bytes -= cached[1].nbytes
+
+        channels = self._channels(template)
+        centered = channels - channels.mean(axis=(1, 2), keepdims=True)
+        spectrum = np.fft.rfft2(centered, s=shape)
+        norm = float(np.square(centered, dtype=np.float64).sum())
+        if self._cached_bytes + spectrum.nbytes <= self.cache_bytes:
+            # 保留模板引用，避免id被复用并用于判断同名模板是否已被替换
+            self._cache[key] = (template, spectrum, norm)
+            self._cached_bytes += spectrum.nbytes
+        return spectrum, norm
+
+    @staticmethod
+    def _window_sums(table, h, w):
+        """由积分图计算所有 h×w 窗口的和"""
+        return table[h:, w:] - table[:-h, w:] - table[h:, :-w] + table[:-h, :-w]
+
+    def match(self, roi, templates, names=None):
+        """
+        逐个产出 (模板, 匹配结果)，结果与 cv2.matchTemplate(roi, 模板, TM_CCOEFF_NORMED) 相同
+        :param names: 与 templates 一一对应的模板名（频谱缓存的键）
+        """
+        channels = self._channels(roi)
+        shape = channels.shape[1:]
+        # 补零到变换尺寸后做循环相关，有效位置的结果不受补零影响
+        padded = self._padded_shape(shape)
+        # ROI去均值不影响分子（模板已去均值），可以减小浮点误差
+        roi_spectrum = np.fft.rfft2(channels - channels.mean(axis=(1, 2), keepdims=True), s=padded)
+        if names is None:
+            names = [None] * len(templates)
+
+        # 各通道的积分图和平方积分图
+        sums, squares = [], []
+        for channel in channels.astype(np.float64):
+            table, square = cv2.integral2(channel)
+            sums.append(table)
+            squares.append(square)
+        window_stats = {}
+
+        for start in range(0, len(templates), self.group_size):
+            group = templates[start:start + self.group_size]
+            group_names = names[start:start + self.group_size]
+            spectra, norms = zip(*(self._spectrum(template, padded, name) for template, name in zip(group, group_names)))
+            # 一组模板一次完成频域相乘、通道求和和逆变换
+            products = (np.conj(np.stack(spectra)) * roi_spectrum[None]).sum(axis=1)
+            correlations = np.fft.irfft2(products, s=padded)
+
+            for template, correlation, norm in zip(group, correlations, norms):
+                h, w = template.shape[:2]
+                if (h, w) not in window_stats:
+                    area = h * w
+                    variance = sum(self._window_sums(sq, h, w) - self._window_sums(t, h, w) ** 2 / area
+                                   for t, sq in zip(sums, squares))
+                    window_stats[(h, w)] = np.sqrt(np.maximum(variance, 0))
+                denominator = window_stats[(h, w)] * np.sqrt(norm)
+                numerator = correlation[:shape[0] - h + 1, :shape[1] - w + 1].astype(np.float64)
+
+                # 与OpenCV相同的处理：分母过小时按分子符号截断
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    result = np.where(
+                        np.abs(numerator) < denominator, numerator / denominator,
+                        np.where(np.abs(numerator) < denominator * 1.125, np.sign(numerator), 0)
+                    )
+                yield template, result.astype(np.float32)
+
+    def maxima(self, roi, templates, names=None):
+        """每个模板的 (最大匹配度, 最大值位置)，放不进ROI的模板返回 (0, None)"""
+        height, width = roi.shape[:2]
+        if names is None:
+            names = [None] * len(templates)
+        fits = [(t, name) for t, name in zip(templates, names) if t.shape[0] <= height and t.shape[1] <= width]
+        found = {}
+        for template, result in self.match(roi, [t for t, _ in fits], [name for _, name in fits]):
+            _, max_val, _, max_loc = cv2.minMaxLoc(result)
+            found[id(template)] = (max_val, max_loc)
+        return [found.get(id(t), (0, None)) for t in templates]
+
+# ================== 数字识别 ==================
+# 手牌费用数字的字形窗口大小 (宽, 高)
+COST_DIGIT_CELL = (16, 24)
+
+class DigitRecognizer:
+    """
+    小号数字识别（最近邻）
+    样本和待识别区域都缩小一半后取固定大小的字形窗口，去均值并归一化为单位向量，
+    两个特征的点积即归一化相关系数。索引在启动时建立一次，识别时把所有区域内各个位置的窗口
+    堆成一个矩阵与索引做一次矩阵乘法。每个区域先取相似度最高的字形，再在同一行左右找不重叠的字形，
+    多位数按从左到右拼接标签；紧挨着的位置有像字形但不够确定的内容时整个区域判为无法识别，
+    避免把两位数只读出一位
+    """
 
-    # 定义扫描区域 (247,151) 到 (1028,312)
-    x1, y1 = 247, 151
-    x2, y2 = 1028, 312
-    width = x2 - x1
-    height = y2 - y1
+    SCALE = 2  # 缩小倍数
+    MAX_GLYPHS = 3  # 每个区域最多读出的字形数
+    GLYPH_SPACING = 0.5  # 相邻字形窗口的最小间距（占窗口宽度的比例）
+    NEIGHBOUR_MARGIN = 0.2  # 紧挨着的位置相似度在 min_confidence 以下这么多以内时判为无法识别
+    INK_TOLERANCE = 2  # 字形窗口左右这么多列（缩小后）以内的笔画算作字形本身
+    INK_RATIO = 0.5  # 窗口外的列对比度达到字形的这个比例时判为还有别的字形
 
-    # 只扫描指定矩形区域
-    roi = screenshot_cv[y1:y2, x1:x2]
+    def __init__(self, samples, cell_size, min_confidence=0.8):
+        """
+        :param samples: [(标签, 灰度样本图), ...]，样本为以单个字形为中心的截图
+        :param cell_size: 字形窗口大小 (宽, 高)，单位为原图像素
+        :param min_confidence: 相似度低于此值时不给出标签
+        """
+        self.cell = (max(1, cell_size[0] // self.SCALE), max(1, cell_size[1] // self.SCALE))
+        self.min_confidence = min_confidence
+        # 缩小时字形相对采样格的相位不同结果也不同，每个样本按四种相位各建一条索引
+        self.labels, cells = [], []
+        for label, image in samples:
+            if image is None:
+                continue
+            for dy, dx in ((0, 0), (0, 1), (1, 0), (1, 1)):
+                self.labels.append(label)
+                cells.append(self._center_cell(self._downscale(image[dy:, dx:])))
+        if cells:
+            self.index = self._normalize(np.stack(cells))
+        else:
+            self.index = np.zeros((0, self.cell[0] * self.cell[1]), dtype=np.float32)
+
+    @classmethod
+    def _downscale(cls, image):
+        h, w = image.shape[:2]
+        size = (max(1, w // cls.SCALE), max(1, h // cls.SCALE))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def _center_cell(self, image):
+        """取图像中心的字形窗口，图像不够大时用边缘像素补齐"""
+        cw, ch = self.cell
+        pad_y, pad_x = max(0, ch - image.shape[0]), max(0, cw - image.shape[1])
+        if pad_y or pad_x:
+            image = cv2.copyMakeBorder(image, pad_y // 2, pad_y - pad_y // 2, pad_x // 2, pad_x - pad_x // 2,
+                                       cv2.BORDER_REPLICATE)
+        y, x = (image.shape[0] - ch) // 2, (image.shape[1] - cw) // 2
+        return image[y:y + ch, x:x + cw]
+
+    @staticmethod
+    def _normalize(windows):
+        """(N, 高, 宽) 的窗口 -> (N, 高*宽) 去均值的单位向量，亮度均匀的窗口为零向量"""
+        flat = windows.reshape(len(windows), -1)
+        flat = flat - flat.mean(axis=1, keepdims=True)
+        norms = np.linalg.norm(flat, axis=1, keepdims=True)
+        return np.divide(flat, norms, out=np.zeros_like(flat), where=norms > 1e-3)
+
+    def _windows(self, image):
+        """
+        区域内所有位置的字形窗口 (N, 高, 宽) 及每行的位置数，窗口按行排列
+        区域比窗口小时补齐后只取一个；左右两边用背景色补出半个窗口，被区域边缘截掉一部分的字形也有窗口
+        """
+        image = self._downscale(image)
+        cw, ch = self.cell
+        image = cv2.copyMakeBorder(image, 0, 0, cw // 2, cw // 2, cv2.BORDER_CONSTANT,
+                                   value=float(np.median(image)))
+        if image.shape[0] < ch or image.shape[1] < cw:
+            return self._center_cell(image)[None], 1, None
+        windows = np.lib.stride_tricks.sliding_window_view(image, (ch, cw))
+        return windows.reshape(-1, ch, cw), windows.shape[1], image
+
+    def _stray_ink(self, image, origins):
+        """
+        读出的字形窗口 [(x, y), ...] 所在的行里，窗口左右是否还有对比度接近字形的列
+        字形可能比窗口略宽，窗口左右 INK_TOLERANCE 列以内不算
+        """
+        cw, ch = self.cell
+        y = min(int(y) for _, y in origins)
+        band = image[y:y + ch]
+        ink = np.abs(band - np.median(band)).max(axis=0)
+        covered = np.zeros(len(ink), dtype=bool)
+        near = np.zeros(len(ink), dtype=bool)
+        for x, _ in origins:
+            covered[int(x):int(x) + cw] = True
+            near[max(0, int(x) - self.INK_TOLERANCE):int(x) + cw + self.INK_TOLERANCE] = True
+        return bool((ink[~near] >= ink[covered].max() * self.INK_RATIO).any()) if (~near).any() else False
+
+    def _read_glyphs(self, similarity, columns, image=None):
+        """
+        从一个区域各位置的相似度 (位置数, 样本数) 读出 (标签, 相似度)
+        多个字形时相似度取最低的一个
+        """
+        scores = similarity.max(axis=1)
+        labels = similarity.argmax(axis=1)
+        xs = np.arange(len(scores)) % columns
+        ys = np.arange(len(scores)) // columns
+        cw, ch = self.cell
+
+        first = int(scores.argmax())
+        if scores[first] < self.min_confidence:
+            return None, float(scores[first])
+
+        glyphs = [first]
+        same_row = np.abs(ys - ys[first]) <= max(1, ch // 4)
+        while len(glyphs) < self.MAX_GLYPHS:
+            free = same_row.copy()
+            for glyph in glyphs:
+                free &= np.abs(xs - xs[glyph]) >= max(1, round(cw * self.GLYPH_SPACING))
+            if not free.any():
+                break
+            candidate = int(np.flatnonzero(free)[scores[free].argmax()])
+            if scores[candidate] >= self.min_confidence:
+                glyphs.append(candidate)
+                continue
+            adjacent = min(abs(int(xs[candidate]) - int(xs[glyph])) for glyph in glyphs) <= cw
+            if adjacent and scores[candidate] >= self.min_confidence - self.NEIGHBOUR_MARGIN:
+                # 旁边还有一个读不准的字形（例如被区域边缘截掉一部分），整体无法确定
+                return None, float(scores[candidate])
+            break
+
+        if image is not None and self._stray_ink(image, [(xs[glyph], ys[glyph]) for glyph in glyphs]):
+            # 读出的字形旁边还有一段笔画（例如被区域边缘截掉一部分的字形），整体无法确定
+            return None, float(min(scores[glyph] for glyph in glyphs))
 
-    # 加载所有护盾模板（彩色）
-    shield_templates = []
-    for filename in os.listdir(shield_dir):
+        glyphs.sort(key=lambda glyph: xs[glyph])
+        label = "".join(self.labels[labels[glyph]] for glyph in glyphs)
+        return label, float(min(scores[glyph] for glyph in glyphs))
+
+    def predict(self, crops):
+        """
+        批量识别，每个区域包含一个数（一个或多个字形）
+        :param crops: 灰度区域图列表
+        :return: [(标签, 相似度), ...]，多位数的标签按从左到右拼接，无法确定时标签为None
+        """
+        if not crops or not len(self.index):
+            return [(None, 0.0) for _ in crops]
+
+        grids = [self._windows(crop) for crop in crops]
+        similarity = self._normalize(np.concatenate([windows for windows, _, _ in grids])) @ self.index.T
+        results = []
+        start = 0
+        for windows, columns, image in grids:
+            results.append(self._read_glyphs(similarity[start:start + len(windows)], columns, image))
+            start += len(windows)
+        return results
+
+    def read(self, frame, regions):
+        """识别一帧中的多个区域 (x1, y1, x2, y2)"""
+        return self.predict([frame.crop_gray(region) for region in regions])
+
+def load_digit_samples():
+    """
+    加载数字样本 [(标签, 灰度图)]
+    费用模板 cost_N.png 标记为N，DIGIT_SAMPLES_DIR 中的图片按文件名下划线前的部分标记
+    """
+    samples = [(str(cost), load_template(TEMPLATES_DIR_COST, f'cost_{cost}.png')) for cost in range(1, 6)]
+    if os.path.isdir(DIGIT_SAMPLES_DIR):
+        for filename in sorted(os.listdir(DIGIT_SAMPLES_DIR)):
+            name, ext = os.path.splitext(filename)
+            if ext.lower() in ('.png', '.jpg', '.jpeg', '.bmp'):
+                samples.append((name.split('_')[0], load_template(DIGIT_SAMPLES_DIR, filename)))
+    return [(label, image) for label, image in samples if image is not None]
+
+# 护盾模板聚类清单（由 python sv-auto.py --dedup-shield --write 生成）
+SHIELD_CLUSTER_FILE = "clusters.json"
+
+def read_shield_template_files():
+    """读取护盾目录下的全部模板，返回 {文件名: 彩色模板}（按文件名排序）"""
+    templates = {}
+    if not os.path.exists(SHIELD_DIR) or not os.path.isdir(SHIELD_DIR):
+        return templates
+
+    for filename in sorted(os.listdir(SHIELD_DIR)):
         if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
-            path = os.path.join(shield_dir, filename)
-            template = cv2.imread(path)  # 以彩色模式读取模板
+            path = os.path.join(SHIELD_DIR, filename)
+            template = template_bundle.get((os.path.normpath(path), 'color'))
+            if template is None:
+                template = cv2.imread(path)  # 以彩色模式读取模板
             if template is not None:
-                shield_templates.append(template)
+                # 保证内存连续，匹配时无需再拷贝
+                templates[filename] = np.ascontiguousarray(template)
+    return templates
+
+def load_shield_clusters():
+    """读取护盾模板聚类清单 {代表模板: [被合并的模板...]}，没有清单时返回空字典"""
+    path = os.path.join(SHIELD_DIR, SHIELD_CLUSTER_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('clusters', {})
+    except Exception as e:
+        logger.warning(f"读取护盾模板聚类清单失败: {str(e)}，加载全部模板")
+        return {}
 
-    # 扫描匹配护盾模板并记录置信度
-    for template in shield_templates:
-        h, w = template.shape[:2]  # 获取彩色模板的高度和宽度
+def load_shield_templates():
+    """
+    加载护盾模板库（彩色），每次运行只解码一次，之后复用内存中的模板
+    有聚类清单时每个聚类只加载代表模板，清单之外新增的模板照常加载
+    """
+    global shield_templates, shield_template_names
+
+    if shield_templates is None:
+        templates = read_shield_template_files()
+
+        # 代表模板存在时跳过同一聚类的其他模板
+        merged = set()
+        for representative, members in load_shield_clusters().items():
+            if representative in templates:
+                merged.update(members)
+
+        shield_template_names = [filename for filename in templates if filename not in merged]
+        shield_templates = [templates[filename] for filename in shield_template_names]
+        if fft_matcher is not None:
+            fft_matcher.clear()
+        if merged:
+            logger.info(f"护盾模板加载完成，共 {len(shield_templates)} 张（聚类合并 {len(templates) - len(shield_templates)} 张）")
+        else:
+            logger.info(f"护盾模板加载完成，共 {len(shield_templates)} 张")
+    return shield_templates
 
-        # 执行彩色模板匹配
-        result = cv2.matchTemplate(roi, template, cv2.TM_CCOEFF_NORMED)
-        threshold = 0.75  # 匹配阈值
+def cluster_shield_templates(templates, threshold=0.9):
+    """
+    按两两相关度对护盾模板聚类
+    模板 j 能以不低于 threshold 的相关度在模板 i 内匹配到时认为 i 包含 j：
+    能匹配到 i 的画面也能匹配到 j，因此每个聚类保留被包含次数最多的模板作为代表
+    :param templates: {文件名: 彩色模板}
+    :return: (聚类 {代表: [成员...]}, 相关度矩阵, 文件名列表)
+    """
+    names = list(templates)
+    count = len(names)
+    scores = np.full((count, count), -1.0, dtype=np.float32)
+    for i, outer in enumerate(names):
+        for j, inner in enumerate(names):
+            big, small = templates[outer], templates[inner]
+            if i != j and small.shape[0] <= big.shape[0] and small.shape[1] <= big.shape[1]:
+                scores[i, j] = cv2.minMaxLoc(cv2.matchTemplate(big, small, cv2.TM_CCOEFF_NORMED))[1]
+
+    contains = scores >= threshold  # contains[i, j]: 模板 i 包含模板 j
+    clusters = {}
+    unassigned = np.ones(count, dtype=bool)
+    while unassigned.any():
+        # 选出在未分配模板中被包含次数最多的模板作为代表
+        coverage = np.where(unassigned, (contains & unassigned[:, None]).sum(axis=0), -1)
+        representative = int(coverage.argmax())
+        members = np.flatnonzero(contains[:, representative] & unassigned)
+        unassigned[members] = False
+        unassigned[representative] = False
+        clusters[names[representative]] = [names[m] for m in members]
+    return clusters, scores, names
+
+def _match_shield_templates(roi, templates, names=None):
+    """逐个产出 (模板, 匹配结果)，启用批量FFT匹配时批量计算，启用匹配线程池时并行计算"""
+    if fft_matcher is not None:
+        yield from fft_matcher.match(roi, templates, names)
+        return
 
-        # 获取所有匹配位置及其置信度
-        loc = np.where(result >= threshold)
-        for pt in zip(*loc[::-1]):  # 遍历所有匹配位置
-            confidence = result[pt[1], pt[0]]  # 获取当前匹配位置的置信度
+    if match_executor is None:
+        for template in templates:
+            yield template, cv2.matchTemplate(roi, template, cv2.TM_CCOEFF_NORMED)
+        return
 
-            # 将相对坐标转换为绝对坐标
-            abs_x = int(pt[0] + x1 + w // 2)
-            abs_y = int(pt[1] + y1 + h // 2)
+    futures = [match_executor.submit(cv2.matchTemplate, roi, template, cv2.TM_CCOEFF_NORMED) for template in templates]
+    for template, future in zip(templates, futures):
+        yield template, future.result()
 
-            # 添加到目标列表（包含坐标和置信度）
-            shield_targets.append({
-                'x': abs_x,
-                'y': abs_y,
-                'confidence': confidence
-            })
+# 敌方随从区域（护盾检测范围）
+ENEMY_FOLLOWER_AREA = (247, 151, 1028, 312)
 
-    # 按置信度从高到低排序
-    shield_targets.sort(key=lambda t: t['confidence'], reverse=True)
+# 护盾匹配阈值
+SHIELD_THRESHOLD = 0.75
 
-    # 只取置信度最高的一个目标
-    if len(shield_targets) > 1:
-        shield_targets = shield_targets[:1]
-    # 提取坐标列表
-    coordinates = [(target['x'], target['y']) for target in shield_targets]
+# 两个护盾目标中心的最小间距（随从位间距约79像素），更近的匹配视为同一目标
+SHIELD_NMS_DISTANCE = 40
 
-    return coordinates
+def find_shield_targets(frame, area, threshold=SHIELD_THRESHOLD, min_distance=SHIELD_NMS_DISTANCE, templates=None):
+    """
+    一次匹配找出区域内所有不同的护盾目标
+    每个模板的匹配结果先用膨胀求局部极大值，再对所有模板的峰值按置信度做非极大值抑制
+    :param area: 扫描区域 (x1, y1, x2, y2)
+    :param templates: 使用的护盾模板列表，不传时使用预加载的护盾模板库
+    :return: [{'x', 'y', 'confidence', 'w', 'h'}]，按置信度从高到低排序
+    """
+    x1, y1, x2, y2 = area
+    roi = frame.crop_bgr(area)
+    names = None
+    if templates is None:
+        templates = load_shield_templates()
+        names = shield_template_names
+    if names is None:
+        names = [None] * len(templates)
+    # 放不进扫描区域的模板跳过
+    fits = [(t, name) for t, name in zip(templates, names) if t.shape[0] <= roi.shape[0] and t.shape[1] <= roi.shape[1]]
+    if not fits:
+        return []
+    templates = [t for t, _ in fits]
+    names = [name for _, name in fits]
+
+    kernel = np.ones((min_distance // 2 * 2 + 1,) * 2, dtype=np.uint8)
+    xs, ys, scores, sizes = [], [], [], []
+    for template, result in _match_shield_templates(roi, templates, names):
+        h, w = template.shape[:2]
+        peaks = (result >= threshold) & (result >= cv2.dilate(result, kernel))
+        peak_y, peak_x = np.nonzero(peaks)
+        if not len(peak_x):
+            continue
+        # 换算为目标中心的绝对坐标
+        xs.append(peak_x + x1 + w // 2)
+        ys.append(peak_y + y1 + h // 2)
+        scores.append(result[peak_y, peak_x])
+        sizes.append(np.repeat([[w, h]], len(peak_x), axis=0))
+
+    if not xs:
+        return []
+    xs, ys = np.concatenate(xs), np.concatenate(ys)
+    scores, sizes = np.concatenate(scores), np.concatenate(sizes)
+
+    # 非极大值抑制：保留置信度最高的峰值，去掉它附近的其他峰值
+    targets = []
+    remaining = np.ones(len(xs), dtype=bool)
+    for i in np.argsort(-scores):
+        if not remaining[i]:
+            continue
+        remaining &= (np.abs(xs - xs[i]) > min_distance) | (np.abs(ys - ys[i]) > min_distance)
+        targets.append({
+            'x': int(xs[i]),
+            'y': int(ys[i]),
+            'confidence': float(scores[i]),
+            'w': int(sizes[i][0]),
+            'h': int(sizes[i][1])
+        })
+    return targets
+
+def shield_target_region(target, margin=30):
+    """护盾目标附近的复查区域（限制在敌方随从区域内）"""
+    half_w = target['w'] // 2 + margin
+    half_h = target['h'] // 2 + margin
+    return (max(ENEMY_FOLLOWER_AREA[0], target['x'] - half_w), max(ENEMY_FOLLOWER_AREA[1], target['y'] - half_h),
+            min(ENEMY_FOLLOWER_AREA[2], target['x'] + half_w), min(ENEMY_FOLLOWER_AREA[3], target['y'] + half_h))
+
+def scan_shield_targets(frame=None):
+    """
+    扫描敌方随从区域(247,151)-(1028,312)内的所有护盾随从（彩色匹配），按置信度从高到低返回坐标列表
+    :param frame: 当前帧，不传时重新截图
+    """
+    if frame is None:
+        frame = take_screenshot()
+    if frame is None:
+        return []
+
+    return [(target['x'], target['y']) for target in find_shield_targets(frame, ENEMY_FOLLOWER_AREA)]
 
 def save_round_statistics():
     """保存回合统计数据到文件"""
@@ -273,9 +1720,63 @@ def load_round_statistics():
     except Exception as e:
         logger.error(f"加载统计数据失败: {str(e)}")
 
+def curved_path(start_x, start_y, end_x, end_y, steps=3):
+    """生成抛物线拖拽路径上的各点（含起点和终点）"""
+    points = [(int(start_x), int(start_y))]
+    for i in range(1, steps + 1):
+        t = i / steps
+        # 模拟抛物线
+        xi = start_x + (end_x - start_x) * t
+        yi = start_y + (end_y - start_y) * (t ** 0.85)
+        points.append((int(xi), int(yi)))
+    points.append((int(end_x), int(end_y)))
+    return points
+
+class GestureBatch:
+    """
+    拖拽手势批处理
+    每条拖拽预先生成完整路径（按下后停顿、抛物线移动、抬起前停顿），
+    提交时每条拖拽只需一次RPC，路径上的时间由设备端控制；
+    设备对象支持 submit_gestures 时整批手势一次提交
+    """
+
+    # uiautomator 每一步的时间（秒）
+    STEP_TIME = 0.005
+
+    def __init__(self):
+        self.gestures = []  # [(路径点, 每段时长, 完成后等待时间)]
+
+    def drag(self, start_x, start_y, end_x, end_y, duration, extra_delay, steps=3, pause=0):
+        """
+        添加一条曲线拖拽
+        :param duration: 移动部分的持续时间（秒）
+        :param extra_delay: 按下后和抬起前的停顿（秒）
+        :param pause: 这条拖拽完成后到下一条之前的等待（秒）
+        """
+        segment = max(duration / steps, self.STEP_TIME)
+        path = curved_path(start_x, start_y, end_x, end_y, steps)
+        # 停顿用重复的路径点表示（每段时长相同）
+        hold = int(round(extra_delay / segment)) if extra_delay > 0 else 0
+        points = [path[0]] * hold + path + [path[-1]] * hold
+        self.gestures.append((points, segment, pause))
+        return self
+
+    def submit(self, u2_device):
+        """提交并清空本批手势，返回本批手势数"""
+        gestures, self.gestures = self.gestures, []
+        if hasattr(u2_device, 'submit_gestures'):
+            u2_device.submit_gestures(gestures)
+            return len(gestures)
+
+        for points, segment, pause in gestures:
+            u2_device.swipe_points(points, segment)
+            if pause > 0:
+                time.sleep(pause)
+        return len(gestures)
+
 def curved_drag(u2_device, start_x, start_y, end_x, end_y, duration, extra_delay, steps=3):
     """
-    模拟曲线拖拽操作
+    模拟曲线拖拽操作（整条路径一次提交）
     :param u2_device: 设备对象
     :param start_x: 起始点x坐标
     :param start_y: 起始点y坐标
@@ -284,21 +1785,7 @@ def curved_drag(u2_device, start_x, start_y, end_x, end_y, duration, extra_delay
     :param duration: 拖拽持续时间（秒）
     :param steps: 拖拽路径中的步骤数
     """
-    u2_device.touch.down(start_x, start_y)
-    time.sleep(extra_delay)
-
-    for i in range(1, steps + 1):
-        t = i / steps
-        # 模拟抛物线
-        xi = start_x + (end_x - start_x) * t
-        yi = start_y + (end_y - start_y) * (t ** 0.85)
-
-        u2_device.touch.move(int(xi), int(yi))
-        time.sleep(duration / steps)
-
-    u2_device.touch.move(end_x, end_y)
-    time.sleep(extra_delay)
-    u2_device.touch.up(end_x, end_y)
+    GestureBatch().drag(start_x, start_y, end_x, end_y, duration, extra_delay, steps).submit(u2_device)
 
 def load_evolution_template(server):
     """加载进化按钮模板"""
@@ -317,7 +1804,7 @@ def load_evolution_template(server):
         evolution_template = create_template_info(
             template_img,
             "进化按钮",
-            threshold=0.85
+            threshold=0.90
         )
     return evolution_template
 
@@ -338,109 +1825,102 @@ def load_super_evolution_template(server):
         super_evolution_template = create_template_info(
             template_img,
             "超进化按钮",
-            threshold=0.85
+            threshold=0.825
         )
     return super_evolution_template
 
-def detect_evolution_button(gray_screenshot, server):
-    """检测进化按钮是否出现"""
+# 进化按钮相对被点击随从的搜索窗口（x1, y1, x2, y2 偏移）
+EVOLUTION_BUTTON_WINDOW = (-230, -200, 230, 200)
+
+def evolution_button_region(slot):
+    """被点击随从附近的进化按钮搜索区域"""
+    x, y = slot
+    return (x + EVOLUTION_BUTTON_WINDOW[0], y + EVOLUTION_BUTTON_WINDOW[1],
+            x + EVOLUTION_BUTTON_WINDOW[2], y + EVOLUTION_BUTTON_WINDOW[3])
+
+def detect_evolution_button(frame, server, slot=None):
+    """检测进化按钮是否出现，传入被点击的随从位置时只在其附近搜索"""
     evolution_info = load_evolution_template(server)
     if not evolution_info:
         return None, 0
 
-    max_loc, max_val = match_template(gray_screenshot, evolution_info)
+    region = evolution_button_region(slot) if slot else None
+    max_loc, max_val = match_template(frame, evolution_info, roi=region)
     return max_loc, max_val
 
-def detect_super_evolution_button(gray_screenshot, server):
-    """检测超进化按钮是否出现"""
+def detect_super_evolution_button(frame, server, slot=None):
+    """检测超进化按钮是否出现，传入被点击的随从位置时只在其附近搜索"""
     evolution_info = load_super_evolution_template(server)
     if not evolution_info:
         return None, 0
 
-    max_loc, max_val = match_template(gray_screenshot, evolution_info)
+    region = evolution_button_region(slot) if slot else None
+    max_loc, max_val = match_template(frame, evolution_info, roi=region)
     return max_loc, max_val
 
 def perform_follower_attacks(u2_device, screenshot, base_colors, config):
-    """检测并执行随从攻击（优先攻击护盾目标）（从右往左尝试攻击）"""
+    """检测并执行随从攻击（优先攻击护盾目标）（从右往左尝试攻击，只拖动有随从的位置）"""
     # 对面主人位置（默认攻击目标）
     default_target = (646, 64)
-    need_scan_shield = True
-
-    # 颜色检测不够准确，先使用旧逻辑
-    if False:
-        for i, pos in enumerate(reversed_follower_positions):
-            x, y = pos
-            attackDelay = 0.03
-            # 获取当前位置的色彩
-            current_color1 = screenshot.getpixel((x, y))
-            # 获取Y轴向下20个像素点的色彩
-            current_color2 = screenshot.getpixel((x, y + 20))
-
-            # 检查基准背景色是否存在
-            if i >= len(base_colors):
-                continue
-            # 获取基准背景色（两个点）
-            base_color1, base_color2 = base_colors[i]
-
-            # 计算当前位置的色彩差异（RGB欧氏距离）
-            r_diff1 = abs(current_color1[0] - base_color1[0])
-            g_diff1 = abs(current_color1[1] - base_color1[1])
-            b_diff1 = abs(current_color1[2] - base_color1[2])
-            color_diff1 = (r_diff1 + g_diff1 + b_diff1) / 3
-
-            # 计算下方20像素点的色彩差异
-            r_diff2 = abs(current_color2[0] - base_color2[0])
-            g_diff2 = abs(current_color2[1] - base_color2[1])
-            b_diff2 = abs(current_color2[2] - base_color2[2])
-            color_diff2 = (r_diff2 + g_diff2 + b_diff2) / 3
-
-            # 如果两个位置中有一个色彩差异超过阈值，则认为有随从
-            if color_diff1 > 25 or color_diff2 > 25:
-                # 扫描护盾目标
-                if need_scan_shield:
-                    shield_targets = scan_shield_targets()
-
-                if shield_targets:
-                    logger.info(f"检测到护盾目标，优先攻击")
-                    target_x, target_y = shield_targets[0]
-                    attackDelay = 1
-                else:
-                    need_scan_shield = False
-                    logger.info(f"未检测到护盾，直接攻击主战者")
-                    target_x, target_y = default_target
-
-                # 确保坐标是整数
-                target_x = int(target_x)
-                target_y = int(target_y)
-                curved_drag(u2_device, x, y, target_x, target_y, 0.03, config["extra_drag_delay"], 3)
-                time.sleep(attackDelay)
+
+    # 找出有随从的位置，无法判断或一个都没检测到时按旧逻辑尝试全部位置
+    # （像素检测可能漏检，从空位拖动没有代价，漏掉整回合的攻击代价大）
+    occupied = detect_occupied_slots(screenshot, base_colors)
+    if occupied:
+        attack_positions = [follower_positions[i] for i in reversed(occupied)]
+        logger.info(f"检测到 {len(attack_positions)} 个随从")
     else:
-        # 后备方案：执行简易坐标
-        # 固定攻击
-        # logger.warning("未找到基准背景色，执行默认攻击")
-        for i, pos in enumerate(reversed_follower_positions):
-            x, y = pos
-            attackDelay = 0.03
-
-            if need_scan_shield:
-                logger.info(f"开始检测护盾")
-                shield_targets = scan_shield_targets()
-            else:
-                logger.info(f"跳过护盾检测")
+        if occupied is not None:
+            logger.info("未检测到随从，尝试全部位置")
+        attack_positions = reversed_follower_positions
+
+    # 一次扫描得到所有护盾目标，之后只复查刚攻击的目标
+    logger.info(f"开始检测护盾")
+    shield_targets = find_shield_targets(screenshot, ENEMY_FOLLOWER_AREA)
+    if shield_targets:
+        logger.info(f"检测到 {len(shield_targets)} 个护盾目标")
+
+    remaining = list(attack_positions)
+    while remaining:
+        x, y = remaining.pop(0)
+        attackDelay = 0.03
+
+        if not shield_targets:
+            # 没有护盾后剩余随从都攻击主战者，整批提交，不再检测护盾
+            logger.info(f"未检测到护盾，剩余随从直接攻击主战者")
+            batch = GestureBatch()
+            for face_x, face_y in [(x, y)] + remaining:
+                batch.drag(face_x, face_y, default_target[0], default_target[1], 0.03, config["extra_drag_delay"], 3, pause=attackDelay)
+            batch.submit(u2_device)
+            break
 
-            if shield_targets:
-                logger.info(f"检测到护盾目标，优先攻击")
-                target_x, target_y = shield_targets[0]
-                attackDelay = 2.1
-            else:
-                need_scan_shield = False
-                logger.info(f"未检测到护盾，直接攻击主战者")
-                target_x, target_y = default_target
-            # 确保坐标是整数
-            target_x = int(target_x)
-            target_y = int(target_y)
-            curved_drag(u2_device, x, y, target_x, target_y, 0.03, config["extra_drag_delay"], 3)
-            time.sleep(attackDelay)
+        logger.info(f"检测到护盾目标，优先攻击")
+        target = shield_targets[0]
+        attackDelay = 2.1
+        curved_drag(u2_device, x, y, target['x'], target['y'], 0.03, config["extra_drag_delay"], 3)
+        # 攻击护盾随从后等待战斗动画结束（画面稳定即可继续，最多2.1秒）
+        wait_until(screen_settled(), attackDelay, min_wait=0.3)
+
+        # 只复查刚攻击的目标附近
+        frame = take_screenshot()
+        if frame is None:
+            # 无法复查时保持原计划
+            continue
+
+        # 重新检测随从位置：有随从阵亡后场上随从会重新居中排列，原来的位置不再可靠
+        if occupied:
+            occupied = detect_occupied_slots(frame, base_colors)
+            if occupied:
+                # 随从的左右顺序不变，从右往左攻击时还没攻击的是最左边的几个
+                remaining = [follower_positions[i] for i in reversed(occupied[:len(remaining)])]
+        still_there = find_shield_targets(frame, shield_target_region(target))
+        if still_there:
+            shield_targets[0] = still_there[0]
+        elif len(shield_targets) > 1:
+            # 目标被消灭后其余随从会重新排列，重新扫描一次
+            shield_targets = find_shield_targets(frame, ENEMY_FOLLOWER_AREA)
+        else:
+            shield_targets = []
 
     # 避免攻击被卡掉 - 使用传入的自定义延迟参数
     time.sleep(config["attack_delay"])
@@ -453,124 +1933,130 @@ def save_round_statistics():
     except Exception as e:
         logger.error(f"保存统计数据失败: {str(e)}")
 
-def perform_evolution_actions(u2_device, screenshot, base_colors):
-    """
-    执行进化/超进化操作（带检测）- 复用颜色检测逻辑
-    :param u2_device: u2设备对象
-    :param screenshot: 当前截图
-    :param base_colors: 基准背景色列表
-    :param is_super: 是否为超进化操作
-    :return: 是否检测到进化按钮
-    """
-    global device
+# 随从位截取区域（相对随从坐标的偏移 x1, y1, x2, y2）
+SLOT_PATCH = (-28, -40, 28, 30)
 
-    evolution_detected = False
+# 各随从位截取区域的列下标（所有随从位在同一行，一次取出全部随从位）
+SLOT_COLUMNS = np.array([[x + dx for dx in range(SLOT_PATCH[0], SLOT_PATCH[2])] for x, _ in follower_positions])
 
-    # 基准背景色检测并不准确，先固定使用旧逻辑
-    return perform_evolution_actions_fallback(u2_device)
+# 与基准的相关系数不低于此值的随从位视为空位，用来估计整帧明暗缩放比例
+SLOT_EMPTY_CORRELATION = 0.9
+# 与基准的相关系数低于此值的随从位不论灰度差多少都视为有随从
+SLOT_OCCUPIED_CORRELATION = 0.6
+# 明暗缩放比例的取值范围
+SLOT_GAIN_RANGE = (0.4, 2.0)
 
-    # 如果无法获取截图，回退到旧逻辑
-    if screenshot is None:
-        logger.warning("无法获取截图，使用旧逻辑进行进化操作")
-        return perform_evolution_actions_fallback(u2_device)
+def slot_patches(frame):
+    """
+    一次取出全部随从位的灰度区域
+    :return: (随从位数, 高, 宽) 的float32数组，每块已减去自身平均亮度，整体明暗变化不影响比较
+    """
+    y = follower_positions[0][1]
+    rows = frame.gray[y + SLOT_PATCH[1]:y + SLOT_PATCH[3]]
+    patches = rows[:, SLOT_COLUMNS].transpose(1, 0, 2).astype(np.float32)
+    patches -= patches.mean(axis=(1, 2), keepdims=True)
+    return patches
 
-    # 如果没有基准背景色，使用旧逻辑
-    if not base_colors:
-        logger.warning("没有基准背景色，使用旧逻辑进行进化操作")
-        return perform_evolution_actions_fallback(u2_device)
+def capture_slot_baseline(frame):
+    """记录空场时各随从位的灰度区域，作为随从占用检测的基准"""
+    return slot_patches(frame)
 
-    # 有护盾时从右侧开始进化，没有护盾时从左侧开始进化
-    exist_shield = scan_shield_targets()
-    if exist_shield:
-        evolve_positions = reversed_follower_positions
-    else:
-        evolve_positions = follower_positions
+def detect_occupied_slots(frame, base_colors):
+    """
+    单帧检测哪些随从位上有随从（全部随从位一次计算）
+    各随从位与基准的平均灰度差超过 slot_occupied_threshold 时认为有随从，比较前先补偿整帧的明暗缩放
+    :param frame: 当前帧
+    :param base_colors: 第1回合记录的随从位基准
+    :return: 有随从的随从位下标列表（对应 follower_positions），无法判断时返回None
+    """
+    if frame is None or base_colors is None:
+        return None
 
-    # 遍历每个随从位置
-    for i, pos in enumerate(evolve_positions):
-        x, y = pos
+    patches = slot_patches(frame)
+    if patches.shape != base_colors.shape:
+        return None
 
-        # 检查基准背景色是否存在
-        if i >= len(base_colors):
-            continue
+    # 整帧被遮罩压暗或闪亮时空随从位的对比度会整体缩放，
+    # 用仍与基准高度相关的随从位（空位）估计缩放比例，比较前先还原
+    products = (patches * base_colors).sum(axis=(1, 2))
+    base_energy = (base_colors * base_colors).sum(axis=(1, 2))
+    patch_energy = (patches * patches).sum(axis=(1, 2))
+    correlation = products / np.maximum(np.sqrt(base_energy * patch_energy), 1e-6)
+    empty_like = correlation >= SLOT_EMPTY_CORRELATION
+    gain = 1.0
+    if empty_like.any():
+        gain = float(np.clip(np.median(products[empty_like] / np.maximum(base_energy[empty_like], 1e-6)),
+                             *SLOT_GAIN_RANGE))
+
+    differences = np.abs(patches / gain - base_colors).mean(axis=(1, 2))
+    # 场上全是随从时无法估计缩放比例，与基准几乎不相关的随从位直接判为有随从
+    occupied = (differences > slot_occupied_threshold) | (correlation < SLOT_OCCUPIED_CORRELATION)
+    return np.flatnonzero(occupied).tolist()
+
+# 进化点/超进化点指示器下方的点数格子区域（己方主战者两侧）
+EVOLUTION_POINT_PIPS = {
+    'evolution': [(544, 526, 555, 538), (562, 526, 573, 538)],
+    'super_evolution': [(701, 526, 712, 538), (723, 526, 734, 538)],
+}
 
-        # 获取当前位置的色彩
-        current_color1 = screenshot.getpixel((x, y))
-        # 获取Y轴向下20个像素点的色彩
-        current_color2 = screenshot.getpixel((x, y + 20))
-        base_color1, base_color2 = base_colors[i]
-
-        # 计算当前位置的色彩差异
-        r_diff1 = abs(current_color1[0] - base_color1[0])
-        g_diff1 = abs(current_color1[1] - base_color1[1])
-        b_diff1 = abs(current_color1[2] - base_color1[2])
-        color_diff1 = (r_diff1 + g_diff1 + b_diff1) / 3
-
-        # 计算下方20像素点的色彩差异
-        r_diff2 = abs(current_color2[0] - base_color2[0])
-        g_diff2 = abs(current_color2[1] - base_color2[1])
-        b_diff2 = abs(current_color2[2] - base_color2[2])
-        color_diff2 = (r_diff2 + g_diff2 + b_diff2) / 3
-
-        # 如果两个位置中有一个色彩差异超过阈值，则认为有随从
-        if color_diff1 > 25 or color_diff2 > 25:
-            # 点击该位置
-            u2_device.click(x, y)
-            time.sleep(0.1)  # 等待进化按钮出现
-
-            # 获取新截图检测进化按钮
-            new_screenshot = take_screenshot()
-            if new_screenshot is None:
-                logger.warning(f"位置 {i} 无法获取截图，跳过检测")
-                continue
+# 每个进化点格子保留最近几次回合开始时点亮状态的亮度
+EVOLUTION_PIP_SAMPLES = 5
 
-            # 转换为OpenCV格式
-            new_screenshot_np = np.array(new_screenshot)
-            new_screenshot_cv = cv2.cvtColor(new_screenshot_np, cv2.COLOR_RGB2BGR)
-            gray_screenshot = cv2.cvtColor(new_screenshot_cv, cv2.COLOR_BGR2GRAY)
-
-            # 同时检查两个检测函数
-            max_loc, max_val = detect_super_evolution_button(gray_screenshot, "国服")
-            if max_val >= 0.825:
-                template_info = load_super_evolution_template("国服")
-                if template_info:
-                    center_x = max_loc[0] + template_info['w'] // 2
-                    center_y = max_loc[1] + template_info['h'] // 2
-                    u2_device.click(center_x, center_y)
-                    logger.info(f"检测到超进化按钮并点击 ")
-                    evolution_detected = True
-                    break
+def capture_evolution_point_baseline(frame):
+    """
+    记录开局时各进化点格子的平均亮度，作为点数读取的基准（'frame' 为整帧平均亮度）
+    开局时进化点还在倒计时锁定中，格子是暗的；'lit' 记录之后每回合开始时格子点亮的亮度，
+    由 update_evolution_point_baseline 更新，每局重新记录
+    """
+    baseline = {
+        name: [float(frame.crop_gray(region).mean()) for region in regions]
+        for name, regions in EVOLUTION_POINT_PIPS.items()
+    }
+    baseline['frame'] = float(frame.downscaled().mean())
+    baseline['lit'] = {name: [[] for _ in regions] for name, regions in EVOLUTION_POINT_PIPS.items()}
+    return baseline
 
-            max_loc1, max_val1 = detect_evolution_button(gray_screenshot, "国服")
-            if max_val1 >= 0.90:
-                template_info = load_evolution_template("国服")
-                if template_info:
-                    center_x = max_loc1[0] + template_info['w'] // 2
-                    center_y = max_loc1[1] + template_info['h'] // 2
-                    u2_device.click(center_x, center_y)
-                    logger.info(f"检测到进化按钮并点击 ")
-                    evolution_detected = True
-                    break
+def _evolution_pip_levels(frame, baseline):
+    """各进化点格子的平均亮度（补偿整帧变暗的部分）"""
+    frame_dimming = max(0.0, baseline['frame'] - float(frame.downscaled().mean()))
+    return {
+        name: [float(frame.crop_gray(region).mean()) + frame_dimming for region in regions]
+        for name, regions in EVOLUTION_POINT_PIPS.items()
+    }
 
-    return evolution_detected
+def update_evolution_point_baseline(frame, baseline):
+    """
+    每回合开始时调用：格子比开局锁定时明显亮时记下这次点亮的亮度（只保留最近 EVOLUTION_PIP_SAMPLES 次）
+    解锁前格子一直是暗的，不会记录，也就不会误判为已用掉
+    """
+    if frame is None or not baseline:
+        return
+    for name, levels in _evolution_pip_levels(frame, baseline).items():
+        for locked, samples, level in zip(baseline[name], baseline['lit'][name], levels):
+            if level - locked > evolution_pip_dim_threshold:
+                samples.append(level)
+                del samples[:-EVOLUTION_PIP_SAMPLES]
 
-def perform_evolution_actions_fallback(u2_device, is_super=False):
+def read_evolution_points(frame, baseline):
     """
-    执行进化/超进化操作的旧逻辑（遍历所有位置）
-    :param device: 设备对象
+    读取剩余的进化点和超进化点数
+    点亮过的格子比最近几次点亮时的最低亮度明显变暗时认为该点已用掉。
+    取最低值而不是最高值：进化光效、回合开始闪光等偶尔偏亮的帧不会把基准抬高，
+    误判为未用掉最多多尝试一次进化，误判为已用掉则会跳过进化。整帧变暗（遮罩、动画）的部分会先扣除
+    :return: {'evolution': 剩余点数, 'super_evolution': 剩余点数}，没有基准时返回None
     """
-    evolution_detected = False
-    logger_word = False
+    if frame is None or not baseline:
+        return None
 
-    # 有护盾时从右侧开始进化，没有护盾时从左侧开始进化
-    exist_shield = scan_shield_targets()
-    if exist_shield:
-        evolve_positions = reversed_follower_positions
-    else:
-        evolve_positions = follower_positions
+    points = {}
+    for name, levels in _evolution_pip_levels(frame, baseline).items():
+        points[name] = sum(1 for samples, level in zip(baseline['lit'][name], levels)
+                           if not samples or min(samples) - level <= evolution_pip_dim_threshold)
+    return points
 
-    # 遍历所有位置
-    for i, pos in enumerate(evolve_positions):
+def _evolve_at_positions(u2_device, positions):
+    """依次点击随从位并检测进化/超进化按钮，检测到后点击按钮"""
+    for i, pos in enumerate(positions):
         follower_x, follower_y = pos
         u2_device.click(follower_x, follower_y)
         time.sleep(0.5)
@@ -582,34 +2068,68 @@ def perform_evolution_actions_fallback(u2_device, is_super=False):
             time.sleep(0.1)
             continue
 
-        # 转换为OpenCV格式
-        screenshot_np = np.array(screenshot)
-        screenshot_cv = cv2.cvtColor(screenshot_np, cv2.COLOR_RGB2BGR)
-        gray_screenshot = cv2.cvtColor(screenshot_cv, cv2.COLOR_BGR2GRAY)
-
-        max_loc, max_val = detect_super_evolution_button(gray_screenshot, "国服")
-        if max_val >= 0.825:
-            template_info = load_super_evolution_template("国服")
+        # 两个按钮都只在该随从附近搜索，共用同一帧的同一块灰度裁剪
+        max_loc, max_val = detect_super_evolution_button(screenshot, "国服", pos)
+        template_info = load_super_evolution_template("国服")
+        if template_info and max_val >= template_info['threshold']:
             center_x = max_loc[0] + template_info['w'] // 2
             center_y = max_loc[1] + template_info['h'] // 2
             u2_device.click(center_x, center_y)
             logger.info(f"检测到超进化按钮并点击")
-            evolution_detected = True
-            break
+            return True
 
-        max_loc1, max_val1 = detect_evolution_button(gray_screenshot, "国服")
-        if max_val1 >= 0.90:  # 检测阈值
-            template_info = load_evolution_template("国服")
+        max_loc1, max_val1 = detect_evolution_button(screenshot, "国服", pos)
+        template_info = load_evolution_template("国服")
+        if template_info and max_val1 >= template_info['threshold']:
             center_x = max_loc1[0] + template_info['w'] // 2
             center_y = max_loc1[1] + template_info['h'] // 2
             u2_device.click(center_x, center_y)
-            if not logger_word:
-                logger.info(f"检测到进化按钮并点击")
-                logger_word = True
-            evolution_detected = True
-            break
+            logger.info(f"检测到进化按钮并点击")
+            return True
+
+    return False
+
+def perform_evolution_actions(u2_device, screenshot, base_colors):
+    """
+    执行进化/超进化操作（带检测）- 先用当前帧找出有随从的位置，只点击这些位置
+    :param u2_device: u2设备对象
+    :param screenshot: 当前截图
+    :param base_colors: 第1回合记录的随从位基准截图
+    :return: 是否检测到进化按钮
+    """
+    occupied = detect_occupied_slots(screenshot, base_colors)
+
+    # 无法判断或未检测到随从时，回退到遍历所有位置的旧逻辑
+    if not occupied:
+        if occupied is None:
+            logger.info("没有随从位基准，使用旧逻辑进行进化操作")
+        else:
+            logger.info("未检测到随从，使用旧逻辑进行进化操作")
+        return perform_evolution_actions_fallback(u2_device, frame=screenshot)
+
+    # 有护盾时从右侧开始进化，没有护盾时从左侧开始进化
+    exist_shield = scan_shield_targets(screenshot)
+    if exist_shield:
+        occupied = occupied[::-1]
+
+    logger.info(f"检测到 {len(occupied)} 个随从，依次尝试进化")
+    return _evolve_at_positions(u2_device, [follower_positions[i] for i in occupied])
+
+def perform_evolution_actions_fallback(u2_device, is_super=False, frame=None):
+    """
+    执行进化/超进化操作的旧逻辑（遍历所有位置）
+    :param device: 设备对象
+    :param frame: 进化前的当前帧，用于护盾检测，不传时重新截图
+    """
+    # 有护盾时从右侧开始进化，没有护盾时从左侧开始进化
+    exist_shield = scan_shield_targets(frame)
+    if exist_shield:
+        evolve_positions = reversed_follower_positions
+    else:
+        evolve_positions = follower_positions
 
-    return evolution_detected
+    # 遍历所有位置
+    return _evolve_at_positions(u2_device, evolve_positions)
 
 def perform_full_actions(u2_device, round_count, base_colors, config):
     """720P分辨率下的出牌攻击操作"""
@@ -629,14 +2149,15 @@ def perform_full_actions(u2_device, round_count, base_colors, config):
         drag_points_x = [600, 700, 684, 551, 830, 501, 900, 405, 959]
     else:
         drag_points_x = [405, 501, 551, 600, 684, 700, 830, 900, 959]
+    batch = GestureBatch()
     for x in drag_points_x:
-        curved_drag(u2_device, x + random.randint(-2, 2), start_y, x + random.randint(-2, 2), end_y, duration, config["extra_drag_delay"], 3)
-        time.sleep(0.05)
+        batch.drag(x + random.randint(-2, 2), start_y, x + random.randint(-2, 2), end_y, duration, config["extra_drag_delay"], 3, pause=0.05)
+    batch.submit(u2_device)
     time.sleep(0.5)
 
     # 执行随从攻击（使用统一函数
     screenshot = take_screenshot()
-    if screenshot:
+    if screenshot is not None:
         perform_follower_attacks(
             u2_device,
             screenshot,
@@ -647,8 +2168,11 @@ def perform_full_actions(u2_device, round_count, base_colors, config):
         logger.error("无法获取截图，跳过攻击操作")
     time.sleep(0.1)
 
-def perform_fullPlus_actions(u2_device, round_count, base_colors, config):
-    """720P分辨率下执行进化/超进化与攻击操作"""
+def perform_fullPlus_actions(u2_device, round_count, base_colors, config, can_evolve=True):
+    """
+    720P分辨率下执行进化/超进化与攻击操作
+    :param can_evolve: 为False时（已确认没有进化点）跳过进化，只出牌和攻击
+    """
     # 不管是不是后手先点能力点的位置再说
     u2_device.click(1173, 500)
     time.sleep(0.1)
@@ -666,13 +2190,14 @@ def perform_fullPlus_actions(u2_device, round_count, base_colors, config):
     else:
         drag_points_x = [405, 501, 551, 600, 684, 700, 830, 900, 959]
 
+    batch = GestureBatch()
     for x in drag_points_x:
-        curved_drag(u2_device, x + random.randint(-2, 2), start_y, x + random.randint(-2, 2), end_y, duration, config["extra_drag_delay"], 3)
-        time.sleep(0.05)
+        batch.drag(x + random.randint(-2, 2), start_y, x + random.randint(-2, 2), end_y, duration, config["extra_drag_delay"], 3, pause=0.05)
+    batch.submit(u2_device)
     time.sleep(0.5)
 
     # 获取当前截图
-    screenshot = take_screenshot()
+    screenshot = take_screenshot() if can_evolve else None
     # 执行进化操作
     if screenshot is not None:
         evolved = perform_evolution_actions(
@@ -681,8 +2206,8 @@ def perform_fullPlus_actions(u2_device, round_count, base_colors, config):
             base_colors,
         )
         if evolved:
-            # 等待最终进化/超进化动画完成
-            time.sleep(6.5)
+            # 等待最终进化/超进化动画完成（画面稳定即可继续，最多6.5秒）
+            wait_until(screen_settled(), 6.5, interval=0.2, min_wait=1)
 
     # 点击空白处关闭面板
     u2_device.click(1026 + random.randint(-2, 2), 178 + random.randint(-2, 2))
@@ -690,7 +2215,7 @@ def perform_fullPlus_actions(u2_device, round_count, base_colors, config):
 
     # 执行随从攻击
     screenshot = take_screenshot()
-    if screenshot:
+    if screenshot is not None:
         perform_follower_attacks(
             u2_device,
             screenshot,
@@ -701,70 +2226,18 @@ def perform_fullPlus_actions(u2_device, round_count, base_colors, config):
         logger.error("无法获取截图，遍历攻击操作")
     time.sleep(0.1)
 
-def scan_self_shield_targets():
-    """扫描己方随从区域的护盾目标（彩色匹配），返回置信度最高的目标"""
-    shield_dir = "shield"
-    shield_targets = []  # 存储所有检测到的护盾目标及其置信度
-
-    # 确保shield目录存在
-    if not os.path.exists(shield_dir) or not os.path.isdir(shield_dir):
-        return []
-
-    screenshot_shield = take_screenshot()
-    if screenshot_shield is None:
+def scan_self_shield_targets(frame=None):
+    """
+    扫描己方随从区域的护盾目标（彩色匹配），按置信度从高到低返回所有目标
+    :param frame: 当前帧，不传时重新截图
+    """
+    if frame is None:
+        frame = take_screenshot()
+    if frame is None:
         return []
 
-    # 将PIL截图转为OpenCV格式
-    screenshot_np = np.array(screenshot_shield)
-    screenshot_cv = cv2.cvtColor(screenshot_np, cv2.COLOR_RGB2BGR)  # RGB转BGR格式
-
-    # 定义扫描区域 (254, 320) 到 (1063, 484) - 己方随从区域
-    x1, y1 = 254, 320
-    x2, y2 = 1063, 484
-    width = x2 - x1
-    height = y2 - y1
-
-    # 只扫描指定矩形区域
-    roi = screenshot_cv[y1:y2, x1:x2]
-
-    # 加载所有护盾模板（彩色）
-    shield_templates = []
-    for filename in os.listdir(shield_dir):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
-            path = os.path.join(shield_dir, filename)
-            template = cv2.imread(path)  # 以彩色模式读取模板
-            if template is not None:
-                shield_templates.append(template)
-
-    # 扫描匹配护盾模板并记录置信度
-    for template in shield_templates:
-        h, w = template.shape[:2]  # 获取彩色模板的高度和宽度
-
-        # 执行彩色模板匹配
-        result = cv2.matchTemplate(roi, template, cv2.TM_CCOEFF_NORMED)
-        threshold = 0.75  # 匹配阈值
-
-        # 获取所有匹配位置及其置信度
-        loc = np.where(result >= threshold)
-        for pt in zip(*loc[::-1]):  # 遍历所有匹配位置
-            confidence = result[pt[1], pt[0]]  # 获取当前匹配位置的置信度
-
-            # 将相对坐标转换为绝对坐标
-            abs_x = int(pt[0] + x1 + w // 2)
-            abs_y = int(pt[1] + y1 + h // 2)
-
-            # 添加到目标列表（包含坐标和置信度）
-            shield_targets.append({
-                'x': abs_x,
-                'y': abs_y,
-                'confidence': confidence
-            })
-
-    # 按置信度从高到低排序
-    shield_targets.sort(key=lambda t: t['confidence'], reverse=True)
-
-    # 返回所有检测到的目标
-    return shield_targets
+    # 扫描区域 (254, 320) 到 (1063, 484) - 己方随从区域
+    return find_shield_targets(frame, (254, 320, 1063, 484))
 
 def enable_ansi_support():
     if sys.platform != "win32":
@@ -780,6 +2253,74 @@ def enable_ansi_support():
     if not kernel32.SetConsoleMode(handle, mode.value | 0x0004):
         return
 
+# 四张手牌的费用检测区域 (x1, y1, x2, y2)
+HAND_COST_REGIONS = [
+    (177, 408, 214, 447),  # 第1张牌的费用区域
+    (382, 411, 421, 453),  # 第2张牌的费用区域
+    (590, 411, 624, 450),  # 第3张牌的费用区域
+    (797, 411, 831, 450),  # 第4张牌的费用区域
+]
+
+def detect_hand_costs(frame, templates_cost, regions=HAND_COST_REGIONS):
+    """
+    识别手牌费用
+    各区域的原图和直方图均衡图横向拼成一张图，每个费用模板只匹配一次，
+    再按各小图的位置范围取最大匹配度（不跨越小图边界，结果与逐个区域匹配相同）
+    原图和均衡图取较高的匹配度，超过阈值的费用中取匹配度最高的，都不超过时为6费+
+    启用数字识别时改用数字识别器，读出多位数或无法确定（例如旁边还有字形）时都按6费+处理
+    :return: [(费用, 匹配度), ...]，6费+的匹配度为1-5费中的最高值
+    """
+    if digit_recognizer is not None:
+        detections = []
+        for label, confidence in digit_recognizer.read(frame, regions):
+            # 未识别出数字或6以上的费用都按6费+处理
+            cost = int(label) if label is not None and label.isdigit() else 6
+            detections.append((min(cost, 6), confidence))
+        return detections
+
+    cost_items = [(cost, templates_cost.get(f'cost_{cost}')) for cost in range(1, 6)]
+    cost_items = [(cost, info) for cost, info in cost_items if info]
+    if not cost_items:
+        return [(6, 0.0) for _ in regions]
+
+    crops = []
+    for region in regions:
+        crops.append(frame.crop_gray(region))
+        crops.append(frame.equalized(region))
+
+    # 拼图：各小图顶部对齐依次向右排列
+    offsets = np.cumsum([0] + [crop.shape[1] for crop in crops])
+    mosaic = np.zeros((max(crop.shape[0] for crop in crops), offsets[-1]), dtype=np.uint8)
+    for crop, x in zip(crops, offsets):
+        mosaic[:crop.shape[0], x:x + crop.shape[1]] = crop
+
+    templates = [info['template'] for _, info in cost_items]
+    if fft_matcher is not None:
+        results = [result for _, result in fft_matcher.match(mosaic, templates, [f'cost_{cost}' for cost, _ in cost_items])]
+    else:
+        results = [cv2.matchTemplate(mosaic, template, cv2.TM_CCOEFF_NORMED) for template in templates]
+
+    # scores[小图, 模板]，模板放不进的小图记为0
+    scores = np.zeros((len(crops), len(templates)), dtype=np.float32)
+    for j, (template, result) in enumerate(zip(templates, results)):
+        th, tw = template.shape[:2]
+        for k, (crop, x) in enumerate(zip(crops, offsets)):
+            h, w = crop.shape[:2]
+            if h >= th and w >= tw:
+                scores[k, j] = result[:h - th + 1, x:x + w - tw + 1].max()
+    scores = scores.reshape(len(regions), 2, len(templates)).max(axis=1)
+
+    thresholds = np.array([info['threshold'] for _, info in cost_items], dtype=np.float32)
+    passed = np.where(scores >= thresholds, scores, -1)
+    detections = []
+    for region_scores, region_passed in zip(scores, passed):
+        best = int(region_passed.argmax())
+        if region_passed[best] > 0:
+            detections.append((cost_items[best][0], float(region_passed[best])))
+        else:
+            detections.append((6, float(region_scores.max())))
+    return detections
+
 # 新增：换牌功能函数
 def perform_card_replacement(strategy, device, templates_cost):
     """
@@ -790,7 +2331,8 @@ def perform_card_replacement(strategy, device, templates_cost):
     """
     try:
         logger.info(f"开始执行换牌检测 - 策略: {strategy}")
-        time.sleep(1)
+        # 等待发牌动画结束
+        wait_until(screen_settled(), 1)
 
         # 重新截图用于费用检测
         card_screenshot = take_screenshot()
@@ -798,67 +2340,25 @@ def perform_card_replacement(strategy, device, templates_cost):
             logger.info("无法获取换牌截图")
             return
 
-        # 转换为OpenCV格式
-        card_screenshot_np = np.array(card_screenshot)
-        card_screenshot_cv = cv2.cvtColor(card_screenshot_np, cv2.COLOR_RGB2BGR)
-        gray_card_screenshot = cv2.cvtColor(card_screenshot_cv, cv2.COLOR_BGR2GRAY)
-
-        # 定义四张手牌的费用检测区域
-        hand_card_regions = [
-            (177, 408, 214, 447),  # 第1张牌的费用区域
-            (382, 411, 421, 453),  # 第2张牌的费用区域
-            (590, 411, 624, 450),  # 第3张牌的费用区域
-            (797, 411, 831, 450),  # 第4张牌的费用区域
-        ]
-
         # 定义手牌中心位置（用于向上滑动）
         hand_card_centers = [
             (274, 518), (477, 527), (681, 521), (884, 524)
         ]
 
-        # 检测每张手牌的费用
-        hand_costs = []
-        for i, region in enumerate(hand_card_regions):
-            x1, y1, x2, y2 = region
-            card_region = gray_card_screenshot[y1:y2, x1:x2]
-
-            # 调试：保存调试图片（可选）
-            # cv2.imwrite(f"debug_card_{i+1}_region.jpg", card_region)
-
-            # 图像预处理
-            card_region_enhanced = cv2.equalizeHist(card_region)
-
-            detected_cost = None
-            max_confidence = 0
-
-            # 检测费用（1-5费）
-            for cost in range(1, 6):
-                cost_type = f'cost_{cost}'
-                if cost_type in templates_cost and templates_cost[cost_type]:
-                    # 对原始和增强图像都进行匹配
-                    max_loc1, max_val1 = match_template(card_region, templates_cost[cost_type])
-                    max_loc2, max_val2 = match_template(card_region_enhanced, templates_cost[cost_type])
-
-                    max_val = max(max_val1, max_val2)
-                    threshold = templates_cost[cost_type]['threshold']
-
-                    logger.info(f"第{i+1}张牌检测{cost}费: 匹配度{max_val:.3f}, 阈值{threshold:.3f}")
-
-                    if max_val >= threshold and max_val > max_confidence:
-                        max_confidence = max_val
-                        detected_cost = cost
-
-            # 如果没有检测到1-5费中的任何一种，默认为6费以上
-            if detected_cost is None:
-                detected_cost = 6
-                logger.info(f"第{i+1}张牌未识别出具体费用，默认为6费+")
-            else:
-                logger.info(f"第{i+1}张牌检测为{detected_cost}费")
-
-            hand_costs.append(detected_cost)
-
-        # 根据策略决定是否需要换牌
-        cards_to_replace = _determine_cards_to_replace(hand_costs, strategy)
+        # 一次识别四张手牌的费用
+        detections = detect_hand_costs(card_screenshot, templates_cost)
+        hand_costs = [cost for cost, _ in detections]
+        logger.info("手牌费用识别: " + ", ".join(
+            f"第{i+1}张{'6费+' if cost == 6 else f'{cost}费'}({confidence:.3f})"
+            for i, (cost, confidence) in enumerate(detections)
+        ))
+
+        # 根据策略决定是否需要换牌（优先查策略表）
+        table = mulligan_tables.get(strategy)
+        if table is not None and tuple(hand_costs) in table:
+            cards_to_replace = list(table[tuple(hand_costs)])
+        else:
+            cards_to_replace = _determine_cards_to_replace(hand_costs, strategy)
 
         # 执行换牌操作
         if cards_to_replace:
@@ -872,7 +2372,8 @@ def perform_card_replacement(strategy, device, templates_cost):
         else:
             logger.info("当前手牌符合策略要求，无需替换")
 
-        time.sleep(1)
+        # 等待换牌动画结束
+        wait_until(screen_settled(), 1)
 
     except Exception as e:
         logger.info(f"换牌操作出错: {str(e)}")
@@ -1066,6 +2567,330 @@ def _check_5_cost_strategy(hand_costs):
     logger.info("不满足5费档次任何组合")
     return None
 
+# ================== 换牌策略表 ==================
+BUILTIN_MULLIGAN_STRATEGIES = ('3费档次', '4费档次', '5费档次')
+MULLIGAN_COSTS = range(1, 7)  # 手牌费用取值，6表示6费+
+
+class _ThreadLogMute(logging.Filter):
+    """丢弃指定线程输出的日志，其他线程（截图流、触控、模板监视等）的日志照常输出"""
+
+    def __init__(self, thread_id):
+        super().__init__()
+        self.thread_id = thread_id
+
+    def filter(self, record):
+        return record.thread != self.thread_id
+
+def compile_mulligan_strategy(decide):
+    """
+    对所有4张手牌的费用组合（1-6费+）各调用一次 decide(手牌费用列表)，
+    生成 {手牌费用元组: 需要替换的位置元组}，换牌时直接查表。编译期间不输出本线程的策略日志
+    """
+    table = {}
+    mute = _ThreadLogMute(threading.get_ident())
+    logger.addFilter(mute)
+    try:
+        for hand in itertools.product(MULLIGAN_COSTS, repeat=4):
+            table[hand] = tuple(decide(list(hand)))
+    finally:
+        logger.removeFilter(mute)
+    return table
+
+def _custom_mulligan_decider(spec, tables):
+    """
+    自定义换牌策略：
+    keep: 保留全部手牌的费用组合列表（不分顺序），如 [[1, 2, 2, 3]]
+    fallback: 不在 keep 中时采用的已有策略名
+    replace_above: 没有 fallback 时替换费用高于此值的牌，默认6（不替换）
+    """
+    keep = {tuple(sorted(combination)) for combination in spec.get("keep", [])}
+    fallback = tables[spec["fallback"]] if spec.get("fallback") else None
+    replace_above = spec.get("replace_above", 6)
+
+    def decide(hand_costs):
+        if tuple(sorted(hand_costs)) in keep:
+            return []
+        if fallback is not None:
+            return fallback[tuple(hand_costs)]
+        return [i for i, cost in enumerate(hand_costs) if cost > replace_above]
+    return decide
+
+def compile_mulligan_strategies(custom=None):
+    """编译内置策略和配置中的自定义策略（自定义策略按配置顺序编译，fallback 只能引用前面的策略）"""
+    tables = {}
+    for strategy in BUILTIN_MULLIGAN_STRATEGIES:
+        tables[strategy] = compile_mulligan_strategy(
+            lambda hand_costs, strategy=strategy: _determine_cards_to_replace(hand_costs, strategy))
+
+    for name, spec in (custom or {}).items():
+        error = _custom_mulligan_error(spec, tables)
+        if error:
+            logger.warning(f"自定义换牌策略 {name} {error}，已跳过")
+            continue
+        tables[name] = compile_mulligan_strategy(_custom_mulligan_decider(spec, tables))
+    return tables
+
+def _custom_mulligan_error(spec, tables):
+    """检查自定义换牌策略的格式，返回错误说明，格式正确时返回None"""
+    if not isinstance(spec, dict):
+        return "格式错误（应为字典）"
+
+    def is_int(value):
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    keep = spec.get("keep", [])
+    if not isinstance(keep, list) or not all(
+            isinstance(combination, list) and len(combination) == 4 and all(is_int(cost) for cost in combination)
+            for combination in keep):
+        return "的 keep 应为由4个整数费用组成的列表的列表，如 [[1, 2, 2, 3]]"
+    if not is_int(spec.get("replace_above", 6)):
+        return "的 replace_above 应为整数"
+    if spec.get("fallback") and (not isinstance(spec["fallback"], str) or spec["fallback"] not in tables):
+        return f"的 fallback 策略 {spec['fallback']} 不存在"
+    return None
+
+# ================== 画面变化检测 ==================
+class FrameChangeGate:
+    """
+    画面变化检测
+    比较当前帧与参考帧的灰度缩略图，取最大差值而不是平均差值，避免按钮这类局部变化被整屏平均掉
+    参考帧默认每次比较后更新为当前帧（比较相邻两帧），update=False 时只在调用 update() 时更新
+    """
+
+    def __init__(self, threshold=6, size=(64, 36)):
+        self.threshold = threshold
+        self.size = size
+        self._last_thumbnail = None
+
+    def changed(self, frame, update=True):
+        """当前帧相对参考帧是否发生明显变化"""
+        thumbnail = frame.downscaled(self.size)
+        last = self._last_thumbnail
+        if update:
+            self.update(frame)
+        if self.threshold <= 0 or last is None:
+            return True
+        return int(cv2.absdiff(thumbnail, last).max()) > self.threshold
+
+    def update(self, frame):
+        """把当前帧设为参考帧"""
+        self._last_thumbnail = frame.downscaled(self.size).copy()
+
+    def reset(self):
+        self._last_thumbnail = None
+
+# ================== 等待条件 ==================
+def wait_until(condition, timeout, interval=0.1, min_wait=0):
+    """
+    轮询截图直到条件满足，用来代替固定的动画等待
+    :param condition: 接收 FrameContext、返回是否满足的函数
+    :param timeout: 最长等待时间（秒），取原来的固定等待时间，超时即相当于原来的固定等待
+    :param interval: 两次截图之间的间隔
+    :param min_wait: 开始检测前至少等待的时间（点击后动画还没开始时画面也是静止的）
+    :return: 超时前条件是否满足
+    """
+    deadline = time.time() + timeout
+    if min_wait > 0:
+        time.sleep(min(min_wait, timeout))
+
+    while True:
+        frame = take_screenshot()
+        if frame is not None and condition(frame):
+            return True
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+
+def screen_settled(frames=2, threshold=6):
+    """等待条件：画面连续 frames 次截图没有明显变化"""
+    gate = FrameChangeGate(threshold)
+    stable_count = 0
+
+    def condition(frame):
+        nonlocal stable_count
+        stable_count = 0 if gate.changed(frame) else stable_count + 1
+        return stable_count >= frames
+    return condition
+
+def template_present(*template_infos):
+    """等待条件：任意一个模板出现（各模板使用自己的搜索区域和阈值）"""
+    def condition(frame):
+        for info in template_infos:
+            if info and match_template(frame, info)[1] >= info['threshold']:
+                return True
+        return False
+    return condition
+
+def template_absent(template_info):
+    """等待条件：模板消失（例如按钮点击生效）"""
+    present = template_present(template_info)
+    return lambda frame: not present(frame)
+
+# ================== 自适应轮询 ==================
+class AdaptivePoller:
+    """
+    自适应轮询间隔
+    刚执行完操作或处于即将轮到我方操作的场景时按下限快速轮询，
+    敌方回合和大厅空闲时按倍数逐步退避到上限
+    """
+
+    # 需要快速响应的场景（换牌后等待回合开始、我方回合结束后等待敌方回合）
+    FAST_SCENES = {'mulligan', 'my_turn'}
+
+    def __init__(self, floor=0.2, ceiling=2, backoff=1.5):
+        self.floor = floor
+        self.ceiling = max(floor, ceiling)
+        self.backoff = backoff
+        self.interval = floor
+        self._last_tick = None
+        self._period = None  # 实际轮询周期（指数平滑）
+
+    def next_interval(self, acted, scene):
+        """根据本次是否执行了操作和当前场景计算下一次轮询间隔"""
+        if acted or scene in self.FAST_SCENES:
+            self.interval = self.floor
+        else:
+            self.interval = min(self.ceiling, self.interval * self.backoff)
+        return self.interval
+
+    def tick(self):
+        """每次轮询开始时调用，统计实际轮询频率"""
+        now = time.time()
+        if self._last_tick is not None:
+            period = now - self._last_tick
+            self._period = period if self._period is None else self._period * 0.8 + period * 0.2
+        self._last_tick = now
+
+    @property
+    def rate(self):
+        """实际轮询频率（次/秒）"""
+        if not self._period:
+            return 0.0
+        return 1.0 / self._period
+
+# ================== 额外模板热加载 ==================
+class TemplateDirWatcher:
+    """
+    额外模板目录监视
+    后台线程定时扫描目录，只解码新增或修改过的图片，变化放入队列，
+    主循环在两次轮询之间取出应用，解码不占用主循环时间
+    """
+
+    VALID_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+    def __init__(self, directory, interval=2):
+        self.directory = directory
+        self.interval = interval
+        self._known = {}  # 文件名 -> (修改时间, 文件大小)
+        self._changes = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _scan(self):
+        """当前目录下各图片的 (修改时间, 文件大小)"""
+        stamps = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and os.path.splitext(entry.name)[1].lower() in self.VALID_EXTENSIONS:
+                        stat = entry.stat()
+                        stamps[entry.name] = (stat.st_mtime, stat.st_size)
+        except OSError:
+            pass
+        return stamps
+
+    def start(self):
+        """以目录当前状态为基准开始监视（启动时已加载的模板不会重复加载）"""
+        self._known = self._scan()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="TemplateDirWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            current = self._scan()
+            for filename in self._known.keys() - current.keys():
+                self._changes.put(('remove', os.path.splitext(filename)[0], None, filename))
+
+            known = {}
+            for filename, stamp in current.items():
+                if self._known.get(filename) == stamp:
+                    known[filename] = stamp
+                    continue
+                template = cv2.imread(os.path.join(self.directory, filename), cv2.IMREAD_GRAYSCALE)
+                if template is None:
+                    # 可能还没写完，下次扫描再试
+                    continue
+                known[filename] = stamp
+                self._changes.put(('update', os.path.splitext(filename)[0], template, filename))
+            self._known = known
+
+    def pending(self):
+        """取出目前为止的所有变化 [(类型, 模板名, 灰度模板, 文件名)]，不等待"""
+        changes = []
+        while True:
+            try:
+                changes.append(self._changes.get_nowait())
+            except queue.Empty:
+                return changes
+
+# ================== 场景状态机 ==================
+class SceneTracker:
+    """
+    主循环场景状态机
+    根据识别到的按钮推断当前场景，每次只匹配当前场景可能出现的模板，
+    候选模板连续多次未匹配时退回匹配全部模板
+    """
+
+    def __init__(self, fallback_misses=3):
+        self.scene = 'unknown'
+        self.fallback_misses = fallback_misses
+        self.miss_count = 0  # 连续未匹配到任何模板的次数
+
+    def candidates(self, templates, extra_names=()):
+        """
+        返回本次需要匹配的模板（保持模板字典的优先级顺序）
+        :param extra_names: 在所有场景都要匹配的模板名（额外模板目录中的模板）
+        """
+        names = SCENE_CANDIDATES.get(self.scene)
+        if names is None or self.miss_count >= self.fallback_misses:
+            return list(templates.items())
+        return [(key, info) for key, info in templates.items() if key in names or key in extra_names]
+
+    def update(self, key):
+        """
+        根据识别到的模板切换场景
+        :return: 场景是否发生变化
+        """
+        scene = TEMPLATE_SCENES.get(key)
+        if scene is None or scene == self.scene:
+            return False
+        self.scene = scene
+        return True
+
+    def reset(self):
+        """回到未知场景（重启应用等情况）"""
+        self.scene = 'unknown'
+        self.miss_count = 0
+
+    def record(self, hit):
+        """记录本次匹配结果"""
+        if hit:
+            self.miss_count = 0
+        else:
+            self.miss_count += 1
+
+    @property
+    def name(self):
+        return SCENE_NAMES.get(self.scene, self.scene)
+
 # ================== UI 相关类 ==================
 class UILogHandler(logging.Handler):
     def __init__(self, log_signal):
@@ -1104,6 +2929,12 @@ class ScriptThread(QThread):
         # 模板字典
         self.templates = {}
 
+        # 来自额外模板目录的模板名
+        self.extra_template_names = set()
+
+        # 额外模板目录监视
+        self.template_watcher = None
+
         # 设置日志处理器
         ui_handler = UILogHandler(self.log_signal)
         ui_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
@@ -1114,7 +2945,9 @@ class ScriptThread(QThread):
         try:
             global device, current_round_count
             global match_start_time, current_run_matches, current_run_start_time
-            global in_match, evolution_template, super_evolution_template, base_colors
+            global in_match, evolution_template, super_evolution_template, base_colors, evolution_point_baseline
+            global shield_templates, template_bundle, screen_stream, touch_stream, fft_matcher, digit_recognizer, mulligan_tables, u2_client, capture_jpeg_quality, slot_occupied_threshold
+            global evolution_pip_dim_threshold
 
             self.start_time = time.time()
             self.status_signal.emit("运行中")
@@ -1136,6 +2969,9 @@ class ScriptThread(QThread):
             evolution_template = None
             super_evolution_template = None
 
+            # 初始化护盾模板库
+            shield_templates = None
+
             # 记录脚本启动时间
             current_run_start_time = datetime.datetime.now()
             current_run_matches = 0
@@ -1144,6 +2980,7 @@ class ScriptThread(QThread):
             #其余初始化
             match_start_time = None
             base_colors = None
+            evolution_point_baseline = None
 
             # 加载历史统计数据
             load_round_statistics()
@@ -1153,31 +2990,25 @@ class ScriptThread(QThread):
             
             # 根据服务器选择模板目录
             templates_dir = TEMPLATES_DIR if self.server == "国服" else TEMPLATES_DIR_INTERNATIONAL
+            extra_dir = self.config.get("extra_templates_dir", "")
 
-            self.templates = {
-                'dailyCard': create_template_info(load_template(templates_dir, 'dailyCard.png'), "每日卡包"),
-                'missionCompleted': create_template_info(load_template(templates_dir, 'missionCompleted.png'), "任务完成"),
-                'backTitle': create_template_info(load_template(templates_dir, 'backTitle.png'), "返回标题"),
-                'errorBackMain': create_template_info(load_template(templates_dir, 'errorBackMain.png'), "遇到错误，返回主页面"),
-                'error_retry': create_template_info(load_template(templates_dir, 'error_retry.png'), "重试"),
-                'Ok': create_template_info(load_template(templates_dir, 'Ok.png'), "好的"),
-                'decision': create_template_info(load_template(templates_dir, 'decision.png'), "决定"),
-                'end_round': create_template_info(load_template(templates_dir, 'end_round.png'), "结束回合"),
-                'enemy_round': create_template_info(load_template(templates_dir, 'enemy_round.png'), "敌方回合"),
-                'end': create_template_info(load_template(templates_dir, 'end.png'), "结束"),
-                'war': create_template_info(load_template(templates_dir, 'war.png'), "决斗"),
-                'mainPage': create_template_info(load_template(templates_dir, 'mainPage.png'), "游戏主页面"),
-                'MuMuPage': create_template_info(load_template(templates_dir, 'MuMuPage.png'), "MuMu主页面"),
-                'LoginPage': create_template_info(load_template(templates_dir, 'LoginPage.png'), "排队主界面", threshold=0.35),
-                'enterGame': create_template_info(load_template(templates_dir, 'enterGame.png'), "排队进入"),
-                'yes': create_template_info(load_template(templates_dir, 'Yes.png'), "继续中断的对战"),
-                'close1': create_template_info(load_template(templates_dir, 'close1.png'), "关闭卡组预览/编辑"),
-                'close2': create_template_info(load_template(templates_dir, 'close2.png'), "关闭卡组预览/编辑"),
-                'backMain': create_template_info(load_template(templates_dir, 'backMain.png'), "返回主页面"),
-                'rankUp': create_template_info(load_template(templates_dir, 'rankUp.png'), "阶位提升"),
-                'groupUp': create_template_info(load_template(templates_dir, 'groupUp.png'), "分组升级"),
-                'rank': create_template_info(load_template(templates_dir, 'rank.png'), "阶级积分"),
-            }
+            # 从模板包加载（按服务器分别打包），先释放上次运行的模板包（FFT匹配器缓存中也有模板引用）
+            template_bundle = {}
+            fft_matcher = None
+            if self.config.get("template_bundle", True):
+                bundle_path = "templates_cn.bundle" if self.server == "国服" else "templates_global.bundle"
+                template_bundle = load_template_bundle(bundle_path, [
+                    (templates_dir, 'gray'),
+                    (TEMPLATES_DIR_COST, 'gray'),
+                    (DIGIT_SAMPLES_DIR, 'gray'),
+                    (extra_dir, 'gray'),
+                    (SHIELD_DIR, 'color'),
+                ])
+                if template_bundle:
+                    self.log_signal.emit(f"已从模板包加载 {len(template_bundle)} 个模板")
+
+            roi_overrides = self.config.get("template_rois", {})
+            self.templates = load_main_templates(templates_dir, roi_overrides)
             
             self.templates_cost = {
                 'cost_1': create_template_info(load_template(TEMPLATES_DIR_COST, 'cost_1.png'), "费用1"),
@@ -1187,7 +3018,6 @@ class ScriptThread(QThread):
                 'cost_5': create_template_info(load_template(TEMPLATES_DIR_COST, 'cost_5.png'), "费用5"),
             }
 
-            extra_dir = self.config.get("extra_templates_dir", "")
             if extra_dir and os.path.isdir(extra_dir):
                 self.log_signal.emit(f"开始加载额外模板目录: {extra_dir}")
 
@@ -1211,14 +3041,19 @@ class ScriptThread(QThread):
                         template_info = create_template_info(
                             template_img,
                             f"额外模板-{template_name}",
-                            threshold=self.config["evolution_threshold"]
+                            threshold=self.config["evolution_threshold"],
+                            roi=roi_overrides.get(template_name)
                         )
 
                         # 添加到模板字典（如果已存在则跳过）
                         if template_name not in self.templates:
                             self.templates[template_name] = template_info
+                            self.extra_template_names.add(template_name)
                             self.log_signal.emit(f"已添加额外模板: {template_name} (来自: {filename})")
 
+            # 预加载护盾模板库，攻击阶段直接复用
+            load_shield_templates()
+
             self.log_signal.emit("模板加载完成")
 
             # 2. 连接设备
@@ -1275,6 +3110,7 @@ class ScriptThread(QThread):
                 # 获取 uiautomator2 设备对象
                 u2_device = u2.connect(target_device.serial)
                 self.u2_device = u2_device
+                u2_client = u2_device
                 self.adb_device = device
                 self.log_signal.emit("设备连接成功")
             except Exception as e:
@@ -1282,6 +3118,70 @@ class ScriptThread(QThread):
                 self.status_signal.emit("连接失败")
                 return
 
+            # 启动持续截图流（可选）
+            stop_screen_stream()
+            if self.config.get("screen_stream", False):
+                self.log_signal.emit("正在启动持续截图流...")
+                screen_stream = start_screen_stream(device, self.config.get("screen_stream_port", 1313))
+                if screen_stream is None:
+                    self.log_signal.emit("持续截图流启动失败，使用普通截图")
+
+            # 启动minitouch触控通道（可选）
+            stop_touch_stream()
+            if self.config.get("input_backend", "u2") == "minitouch":
+                self.log_signal.emit("正在启动minitouch触控通道...")
+                touch_stream = start_touch_stream(device, self.config.get("touch_stream_port", 1111))
+                if touch_stream is not None:
+                    try:
+                        screen_size = device.window_size()
+                        rotation = device.rotation() * 90
+                    except Exception:
+                        screen_size, rotation = (1280, 720), 0
+                    self.u2_device = MinitouchDevice(u2_device, touch_stream, screen_size, rotation)
+                    self.log_signal.emit("已使用minitouch触控通道")
+                else:
+                    self.log_signal.emit("minitouch触控通道启动失败，使用uiautomator2操作")
+
+            # 选择截图后端
+            capture_jpeg_quality = self.config.get("capture_jpeg_quality", 60)
+            slot_occupied_threshold = self.config.get("slot_occupied_threshold", 18)
+            evolution_pip_dim_threshold = self.config.get("evolution_pip_dim_threshold", 25)
+            self.log_signal.emit("正在测试截图后端...")
+            backend_name, backend_timings = select_capture_backend(
+                self.config.get("capture_backend", "auto"),
+                self.config.get("capture_benchmark_frames", 3)
+            )
+            for name, seconds in backend_timings.items():
+                self.log_signal.emit(f"截图后端 {name}: {seconds * 1000:.1f}ms/帧")
+            if backend_name in backend_timings:
+                self.log_signal.emit(f"已选择截图后端: {backend_name} ({backend_timings[backend_name] * 1000:.1f}ms/帧)")
+            else:
+                self.log_signal.emit(f"已选择截图后端: {backend_name}")
+
+            # 批量FFT匹配（可选）
+            fft_matcher = None
+            if self.config.get("fft_matching", False):
+                fft_matcher = FFTMatcher(cache_mb=self.config.get("fft_cache_mb", 256))
+                self.log_signal.emit("已启用批量FFT模板匹配")
+
+            # 编译换牌策略表
+            mulligan_tables = compile_mulligan_strategies(self.config.get("custom_mulligan_strategies", {}))
+            if self.card_replacement_strategy not in mulligan_tables:
+                self.log_signal.emit(f"换牌策略 {self.card_replacement_strategy} 不存在，使用3费档次")
+                self.card_replacement_strategy = '3费档次'
+
+            # 费用数字识别（可选）
+            digit_recognizer = None
+            if self.config.get("digit_recognition", False):
+                samples = load_digit_samples()
+                digit_recognizer = DigitRecognizer(samples, COST_DIGIT_CELL,
+                                                   self.config.get("digit_min_confidence", 0.8))
+                self.log_signal.emit(f"已启用费用数字识别: {len(samples)} 个样本")
+
+            # 启动模板匹配线程池（可选）
+            if start_match_executor(self.config.get("match_workers", 0)):
+                self.log_signal.emit(f"已启用并行模板匹配: {self.config['match_workers']} 线程")
+
             # 新增：重启应用的函数
             def restart_app():
                 """重启游戏应用"""
@@ -1294,7 +3194,14 @@ class ScriptThread(QThread):
 
                     # 重新启动应用
                     self.adb_device.shell(f"monkey -p {app_package} -c android.intent.category.LAUNCHER 1")
-                    time.sleep(5)  # 等待应用启动
+                    # 等待应用启动并加载到游戏内界面（至少5秒，最多25秒）
+                    # 模拟器桌面模板和低阈值模板在游戏加载完成前就可能匹配，不作为加载完成的依据
+                    game_templates = [
+                        info for key, info in self.templates.items()
+                        if info and not key.startswith('MuMuPage') and info['threshold'] >= 0.8
+                    ]
+                    if not wait_until(template_present(*game_templates), 25, interval=1, min_wait=5):
+                        self.log_signal.emit("应用重启后未识别到已知界面，继续运行")
 
                     self.log_signal.emit("应用重启完成")
                     return True
@@ -1320,13 +3227,9 @@ class ScriptThread(QThread):
 
             # 3. 检测脚本启动时是否已经在对战中
             self.log_signal.emit("检测当前游戏状态...")
+            scene_tracker = SceneTracker(self.config.get("scene_fallback_misses", 3))
             init_screenshot = take_screenshot()
             if init_screenshot is not None:
-                # 转换为OpenCV格式
-                init_screenshot_np = np.array(init_screenshot)
-                init_screenshot_cv = cv2.cvtColor(init_screenshot_np, cv2.COLOR_RGB2BGR)
-                gray_init_screenshot = cv2.cvtColor(init_screenshot_cv, cv2.COLOR_BGR2GRAY)
-
                 # 检测是否已经在游戏中
                 end_round_info = self.templates['end_round']
                 enemy_round_info = self.templates['enemy_round']
@@ -1334,29 +3237,32 @@ class ScriptThread(QThread):
                 
                 # 检测换牌开场
                 if decision_info:
-                    max_loc, max_val = match_template(gray_init_screenshot, decision_info)
+                    max_loc, max_val = match_template(init_screenshot, decision_info)
                     if max_val >= decision_info['threshold']:
                         in_match = True
                         match_start_time = time.time()
                         current_round_count = 1
+                        scene_tracker.update('decision')
                         self.log_signal.emit("脚本启动时检测到已处于换牌阶段，自动设置回合数为1")    
 
                 # 检测我方回合
                 if end_round_info:
-                    max_loc, max_val = match_template(gray_init_screenshot, end_round_info)
+                    max_loc, max_val = match_template(init_screenshot, end_round_info)
                     if max_val >= end_round_info['threshold']:
                         in_match = True
                         match_start_time = time.time()
                         current_round_count = 2
+                        scene_tracker.update('end_round')
                         self.log_signal.emit("脚本启动时检测到已处于我方回合，自动设置回合数为2")
 
                 # 检测敌方回合
                 if enemy_round_info:
-                    max_loc, max_val = match_template(gray_init_screenshot, enemy_round_info)
+                    max_loc, max_val = match_template(init_screenshot, enemy_round_info)
                     if max_val >= enemy_round_info['threshold']:
                         in_match = True
                         match_start_time = time.time()
                         current_round_count = 2
+                        scene_tracker.update('enemy_round')
                         self.log_signal.emit("脚本启动时检测到已处于敌方回合，自动设置回合数为2")
 
             else:
@@ -1364,6 +3270,7 @@ class ScriptThread(QThread):
 
             last_detected_button = None
             base_colors = None
+            evolution_point_baseline = None
 
             # 5. 主循环
             self.log_signal.emit("脚本初始化完成，开始运行...")
@@ -1385,6 +3292,35 @@ class ScriptThread(QThread):
             needLogPause = True
             needAddRoundCount = True
 
+            # 搜索区域全屏兜底：连续未匹配到任何模板时做一次全屏匹配
+            ROI_FALLBACK_MISSES = self.config.get("roi_fallback_misses", 5)
+            # 定期全屏匹配：主页面、排队界面等几乎每次都命中的模板会让上面的计数一直归零，
+            # 其他模板的搜索区域放错时只能靠定期全屏匹配发现并扩展
+            ROI_FULL_FRAME_INTERVAL = self.config.get("roi_full_frame_interval", 30)
+            sweeps_since_full_frame = 0
+
+            # 画面未变化时复用上次的检测结果
+            frame_gate = FrameChangeGate(self.config.get("frame_change_threshold", 6))
+            last_sweep_keys = None  # 上次匹配的模板列表
+            last_hits = []  # 上次达到阈值的匹配结果
+            skipped_sweeps = 0
+            reused_sweeps = 0  # 连续复用检测结果的次数
+            # 连续复用达到上限后强制完整匹配，避免画面小变化被漏掉时一直沿用旧结论
+            MAX_REUSED_SWEEPS = self.config.get("max_reused_sweeps", 5)
+
+            # 监视额外模板目录，新增、修改、删除的模板在主循环中增量更新
+            watch_interval = self.config.get("extra_templates_watch_interval", 2)
+            if extra_dir and os.path.isdir(extra_dir) and watch_interval:
+                self.template_watcher = TemplateDirWatcher(extra_dir, watch_interval)
+                self.template_watcher.start()
+
+            # 自适应轮询间隔
+            poller = AdaptivePoller(
+                self.config.get("poll_floor", 0.2),
+                self.config.get("poll_ceiling") or SCAN_INTERVAL,
+                self.config.get("poll_backoff", 1.5)
+            )
+
             while self.running:
                 start_time = time.time()
 
@@ -1403,40 +3339,69 @@ class ScriptThread(QThread):
                 if check_inactivity():
                     if restart_app():
                         reset_activity_timer()
-                        # 重启后等待一段时间让应用完全加载
-                        time.sleep(20)
                         # 重置相关状态
                         in_match = False
                         last_detected_button = None
                         base_colors = None
+                        evolution_point_baseline = None
+                        scene_tracker.reset()
+                        frame_gate.reset()
+                        last_sweep_keys = None
                         continue
                     else:
                         self.error_signal.emit("重启应用失败，请检查模拟器是否正常运行")
 
+                # 应用额外模板目录的变化（解码已在后台完成）
+                if self.template_watcher is not None:
+                    changes = self.template_watcher.pending()
+                    if changes and self.apply_template_changes(changes, roi_overrides):
+                        last_sweep_keys = None
+
                 # 获取截图
                 needLogPause = True
+                poller.tick()
                 screenshot = take_screenshot()
                 # debug
-                # from PIL import Image
-                # screenshot = Image.open('./test_resource/1.png')
+                # screenshot = FrameContext(cv2.imread('./test_resource/1.png'), 'BGR')
 
                 if screenshot is None:
                     time.sleep(SCAN_INTERVAL)
                     continue
 
-                # 转换为OpenCV格式
-                screenshot_np = np.array(screenshot)
-                screenshot_cv = cv2.cvtColor(screenshot_np, cv2.COLOR_RGB2BGR)
-                gray_screenshot = cv2.cvtColor(screenshot_cv, cv2.COLOR_BGR2GRAY)
-
                 # 检查其他按钮
                 button_detected = False
-                for key, template_info in self.templates.items():  # 遍历所有模板（包括动态加载的）
-                    if not template_info:
-                        continue
-
-                    max_loc, max_val = match_template(gray_screenshot, template_info)
+                template_hit = False
+                full_frame = (scene_tracker.miss_count >= ROI_FALLBACK_MISSES
+                              or 0 < ROI_FULL_FRAME_INTERVAL <= sweeps_since_full_frame)
+                sweeps_since_full_frame = 0 if full_frame else sweeps_since_full_frame + 1
+                # 只遍历当前场景可能出现的模板（包括动态加载的），连续未匹配时遍历全部模板
+                # 按模板字典顺序处理，先匹配到的按钮优先
+                candidates = scene_tracker.candidates(self.templates, self.extra_template_names)
+                sweep_keys = [key for key, _ in candidates]
+                # 与上次实际匹配时的画面比较，缓慢变化累积超过阈值后也会重新匹配
+                screen_changed = frame_gate.changed(screenshot, update=False)
+                matches = None
+                if (not screen_changed and not full_frame and sweep_keys == last_sweep_keys
+                        and reused_sweeps < MAX_REUSED_SWEEPS):
+                    # 画面与上次基本相同：复用“没有命中”的结论，或只重新匹配上次命中的模板，不按旧坐标点击
+                    matches = rematch_hits(screenshot, last_hits)
+                if matches is not None:
+                    skipped_sweeps += 1
+                    reused_sweeps += 1
+                else:
+                    frame_gate.update(screenshot)
+                    reused_sweeps = 0
+                    last_hits = []
+                    matches = record_hits(match_templates(screenshot, candidates, full_frame), last_hits)
+                last_sweep_keys = sweep_keys
+                for key, template_info, max_loc, max_val in matches:
                     if max_val >= template_info['threshold']:
+                        template_hit = True
+                        if full_frame and expand_template_roi(template_info, max_loc):
+                            self.log_signal.emit(f"模板 {key} 出现在搜索区域外，已扩展搜索区域: {template_info['roi']}")
+                        if scene_tracker.update(key):
+                            self.log_signal.emit(f"场景切换: {scene_tracker.name}")
+
                         if key != last_detected_button:
                             reset_activity_timer()  # 重置活动计时器
                             if key == 'end_round' and in_match:
@@ -1452,7 +3417,7 @@ class ScriptThread(QThread):
                             self.log_signal.emit("换牌完成，点击决定按钮")
                             last_detected_button = key
                             button_detected = True
-                            time.sleep(1)
+                            wait_until(template_absent(template_info), 1)
                             break
 
                         # 处理每日卡包
@@ -1470,6 +3435,7 @@ class ScriptThread(QThread):
                                 self.log_signal.emit("检测到新对战开始，结束上一场对战")
                             # 开始新的对战
                             base_colors = None  # 重置开局基准背景色
+                            evolution_point_baseline = None
                             self.start_new_match()
                             in_match = True
                             self.log_signal.emit("检测到新对战开始")
@@ -1480,20 +3446,14 @@ class ScriptThread(QThread):
                                 self.log_signal.emit("检测到敌方回合")
                                 needAddRoundCount = True
                                 last_detected_button = key
-                            time.sleep(1)
+                            # 敌方回合的等待交给自适应轮询退避
                             continue
 
                         if key == 'end_round' and in_match:
                             # 新增：在第一回合且未出牌时记录基准背景色
                             if current_round_count == 1 and base_colors is None:
-                                base_colors = []
-                                for pos in follower_positions:
-                                    x, y = pos
-                                    # 记录当前位置的色彩
-                                    color1 = screenshot.getpixel((x, y))
-                                    # 记录Y轴向下20个像素点的色彩
-                                    color2 = screenshot.getpixel((x, y + 20))
-                                    base_colors.append((color1, color2))
+                                base_colors = capture_slot_baseline(screenshot)
+                                evolution_point_baseline = capture_evolution_point_baseline(screenshot)
                                 self.log_signal.emit("第1回合，记录基准背景色完成")
 
                             # self_shield_targets = scan_self_shield_targets()
@@ -1515,9 +3475,18 @@ class ScriptThread(QThread):
                             #     button_detected = True
                             #     break
 
+                            # 回合开始时进化点格子还没用，用来把基准更新为点亮后的亮度
+                            update_evolution_point_baseline(screenshot, evolution_point_baseline)
+
                             if current_round_count in (4, 5, 6, 7, 8):  # 第4 ，5，6 ,7,8回合
-                                self.log_signal.emit(f"第{current_round_count}回合，执行进化/超进化")
-                                perform_fullPlus_actions(self.u2_device, current_round_count, base_colors, self.config)
+                                # 用当前帧读取剩余进化点，确定没有可用点数时跳过进化
+                                evolution_points = read_evolution_points(screenshot, evolution_point_baseline)
+                                if evolution_points is not None and not any(evolution_points.values()):
+                                    self.log_signal.emit(f"第{current_round_count}回合，进化点已用完，跳过进化")
+                                    perform_fullPlus_actions(self.u2_device, current_round_count, base_colors, self.config, can_evolve=False)
+                                else:
+                                    self.log_signal.emit(f"第{current_round_count}回合，执行进化/超进化")
+                                    perform_fullPlus_actions(self.u2_device, current_round_count, base_colors, self.config)
                             elif current_round_count > 30:   #30回合以上弃权防止烧绳
                                 self.log_signal.emit(f"30回合以上，直接弃权")
                                 time.sleep(0.5)
@@ -1545,9 +3514,13 @@ class ScriptThread(QThread):
                             self.log_signal.emit(f"检测到按钮并点击: {template_info['name']} ")
                         # 更新状态跟踪
                         last_detected_button = key
-                        time.sleep(0.5)
+                        # 按钮消失说明点击已生效
+                        wait_until(template_absent(template_info), 0.5)
                         break
 
+                # 更新未匹配计数（全屏匹配过一次后重新计数）
+                scene_tracker.record(template_hit or full_frame)
+
                 # 如果没有检测到任何按钮，但截图成功，也算作一种活动（证明游戏还在响应）
                 if not button_detected:
                     # 可以选择性地更新活动时间，但频率不要太高
@@ -1559,19 +3532,27 @@ class ScriptThread(QThread):
                     'current_turn': current_round_count,
                     'run_time': int(time.time() - self.start_time),
                     'battle_count': current_run_matches,
-                    'turn_count': current_round_count * current_run_matches
+                    'turn_count': current_round_count * current_run_matches,
+                    'skipped_sweeps': skipped_sweeps,
+                    'poll_rate': round(poller.rate, 2)
                 }
                 self.stats_signal.emit(stats)
 
-                # 计算处理时间并调整等待
+                # 计算处理时间并按自适应间隔等待
                 process_time = time.time() - start_time
-                sleep_time = max(0, SCAN_INTERVAL - process_time)
+                sleep_time = max(0, poller.next_interval(button_detected, scene_tracker.scene) - process_time)
                 time.sleep(sleep_time)
 
             # 结束当前对战（如果正在进行）
             if in_match:
                 self.end_current_match()
 
+            # 关闭截图流和匹配线程池
+            stop_screen_stream()
+            stop_touch_stream()
+            stop_match_executor()
+            self.stop_template_watcher()
+
             # 保存统计数据
             save_round_statistics()
 
@@ -1589,10 +3570,54 @@ class ScriptThread(QThread):
         except Exception as e:
             error_msg = f"脚本运行出错: {str(e)}"
             logger.error(error_msg)
+            stop_screen_stream()
+            stop_touch_stream()
+            stop_match_executor()
+            self.stop_template_watcher()
             self.status_signal.emit("已停止")
             self.error_signal.emit(f"{str(e)}")
             return
 
+    def apply_template_changes(self, changes, roi_overrides):
+        """
+        把额外模板目录的变化应用到模板字典
+        与内置模板同名的文件和启动时一样跳过
+        :return: 模板字典是否有变化
+        """
+        changed = False
+        for change, template_name, template_img, filename in changes:
+            if change == 'remove':
+                if template_name in self.extra_template_names:
+                    self.extra_template_names.discard(template_name)
+                    self.templates.pop(template_name, None)
+                    self.log_signal.emit(f"已移除额外模板: {template_name}")
+                    changed = True
+                continue
+
+            if template_name in self.templates and template_name not in self.extra_template_names:
+                continue
+
+            is_new = template_name not in self.templates
+            self.templates[template_name] = create_template_info(
+                template_img,
+                f"额外模板-{template_name}",
+                threshold=self.config["evolution_threshold"],
+                roi=roi_overrides.get(template_name)
+            )
+            self.extra_template_names.add(template_name)
+            if is_new:
+                self.log_signal.emit(f"已添加额外模板: {template_name} (来自: {filename})")
+            else:
+                self.log_signal.emit(f"已更新额外模板: {template_name} (来自: {filename})")
+            changed = True
+        return changed
+
+    def stop_template_watcher(self):
+        """停止额外模板目录监视"""
+        if self.template_watcher is not None:
+            self.template_watcher.stop()
+            self.template_watcher = None
+
     def start_new_match(self):
         """开始新的对战"""
         global current_round_count, match_start_time, current_run_matches
@@ -1857,7 +3882,7 @@ class ShadowverseAutomationUI(QMainWindow):
         # 策略选择
         strategy_label = QLabel("换牌策略:")
         self.strategy_combo = QComboBox()
-        self.strategy_combo.addItems(['3费档次', '4费档次', '5费档次'])
+        self.strategy_combo.addItems(list(BUILTIN_MULLIGAN_STRATEGIES) + list(self.config.get("custom_mulligan_strategies", {})))
         self.strategy_combo.setCurrentText('3费档次')  # 默认选择3费档次
 
         strategy_layout.addWidget(strategy_label)
@@ -1959,6 +3984,17 @@ class ShadowverseAutomationUI(QMainWindow):
         self.turn_count_label = QLabel("0")
         self.turn_count_label.setObjectName("StatValue")
         stats_layout.addWidget(self.turn_count_label, 1, 3)
+
+        # 第三行统计信息
+        stats_layout.addWidget(QLabel("跳过扫描:"), 2, 0)
+        self.skipped_sweeps_label = QLabel("0")
+        self.skipped_sweeps_label.setObjectName("StatValue")
+        stats_layout.addWidget(self.skipped_sweeps_label, 2, 1)
+
+        stats_layout.addWidget(QLabel("轮询频率:"), 2, 2)
+        self.poll_rate_label = QLabel("0")
+        self.poll_rate_label.setObjectName("StatValue")
+        stats_layout.addWidget(self.poll_rate_label, 2, 3)
         
         main_layout.addWidget(stats_frame)
         
@@ -2141,6 +4177,8 @@ class ShadowverseAutomationUI(QMainWindow):
     • 目标：确保5费时能打出关键牌
 
     注意：高档次策略条件不满足时会自动检查低档次策略
+
+    可在 config.json 的 custom_mulligan_strategies 中添加自定义策略
         """
 
         msg = QMessageBox()
@@ -2169,6 +4207,8 @@ class ShadowverseAutomationUI(QMainWindow):
         self.update_run_time()
         self.battle_count_label.setText(str(stats['battle_count']))
         self.turn_count_label.setText(str(stats['turn_count']))
+        self.skipped_sweeps_label.setText(str(stats.get('skipped_sweeps', 0)))
+        self.poll_rate_label.setText(f"{stats.get('poll_rate', 0)}次/秒")
 
     def update_run_time(self):
         hours = self.run_time // 3600
@@ -2194,7 +4234,82 @@ class ShadowverseAutomationUI(QMainWindow):
             self.script_thread.wait()
         event.accept()
 
+# ================== 护盾模板整理工具 ==================
+def _shield_coverage(labels_dir, labels, templates):
+    """统计模板库在标注截图上的检出情况，返回 (命中标注数, 误检数, 漏检列表, 平均耗时)"""
+    hit, false_positive, missed, elapsed = 0, 0, [], 0.0
+    for filename, points in labels.items():
+        image = cv2.imread(os.path.join(labels_dir, filename))
+        if image is None:
+            logger.warning(f"无法读取标注截图: {filename}")
+            continue
+        start = time.time()
+        targets = find_shield_targets(FrameContext(image), ENEMY_FOLLOWER_AREA, templates=templates)
+        elapsed += time.time() - start
+
+        def near(target, point):
+            return abs(target['x'] - point[0]) <= SHIELD_NMS_DISTANCE and abs(target['y'] - point[1]) <= SHIELD_NMS_DISTANCE
+
+        for point in points:
+            if any(near(target, point) for target in targets):
+                hit += 1
+            else:
+                missed.append((filename, tuple(point)))
+        false_positive += sum(1 for target in targets if not any(near(target, point) for point in points))
+    return hit, false_positive, missed, elapsed / max(1, len(labels))
+
+def shield_dedup_main(argv):
+    """
+    护盾模板去重工具：python sv-auto.py --dedup-shield [--threshold 0.9] [--labels 目录] [--write]
+    --labels 目录下需要有 labels.json：{"截图文件名": [[护盾中心x, 护盾中心y], ...]}，没有护盾的截图对应空列表
+    --write 把聚类结果写入 shield/clusters.json，之后运行脚本时每个聚类只加载代表模板
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="sv-auto.py --dedup-shield", description="护盾模板聚类去重")
+    parser.add_argument("--threshold", type=float, default=0.9, help="判定为同一模板的最低相关度")
+    parser.add_argument("--labels", help="标注截图目录（含 labels.json），用于统计去重前后的检出率")
+    parser.add_argument("--write", action="store_true", help="写入聚类清单 shield/clusters.json")
+    args = parser.parse_args(argv)
+
+    templates = read_shield_template_files()
+    if not templates:
+        logger.error(f"护盾目录 {SHIELD_DIR} 中没有模板")
+        return 1
+
+    clusters, scores, names = cluster_shield_templates(templates, args.threshold)
+    index = {name: i for i, name in enumerate(names)}
+    logger.info(f"护盾模板 {len(templates)} 张，聚类后 {len(clusters)} 张（阈值 {args.threshold}）")
+    for representative, members in clusters.items():
+        if members:
+            details = ", ".join(f"{m}({scores[index[m], index[representative]]:.2f})" for m in members)
+            logger.info(f"  {representative} <- {details}")
+
+    if args.labels:
+        with open(os.path.join(args.labels, "labels.json"), 'r', encoding='utf-8') as f:
+            labels = json.load(f)
+        total = sum(len(points) for points in labels.values())
+        compact = [templates[name] for name in clusters]
+        for title, bank in (("全部模板", list(templates.values())), ("聚类后", compact)):
+            hit, false_positive, missed, seconds = _shield_coverage(args.labels, labels, bank)
+            logger.info(f"{title}: 检出 {hit}/{total}，误检 {false_positive}，平均 {seconds * 1000:.0f}ms/张")
+            for filename, point in missed:
+                logger.info(f"  漏检 {filename} {point}")
+
+    if args.write:
+        path = os.path.join(SHIELD_DIR, SHIELD_CLUSTER_FILE)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'threshold': args.threshold,
+                'clusters': {rep: members for rep, members in clusters.items() if members}
+            }, f, ensure_ascii=False, indent=2)
+        logger.info(f"聚类清单已写入 {path}")
+    return 0
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--dedup-shield":
+        sys.exit(shield_dedup_main(sys.argv[2:]))
+
     try:
         app = QApplication(sys.argv)
         window = ShadowverseAutomationUI()
@@ -2203,4 +4318,4 @@ if __name__ == "__main__":
     except Exception as e:
         logger.error(f"程序崩溃: {e}")
         # 弹窗提示错误
-        QMessageBox.critical(None， "错误", f"程序崩溃: {e}")
+        QMessageBox.critical(None, "错误", f"程序崩溃: {e}")
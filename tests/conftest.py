@@ -0,0 +1,84 @@
+import importlib.util
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+@pytest.fixture(scope="session")
+def sv():
+    """按路径导入 sv-auto.py（文件名带连字符，不能直接 import）"""
+    spec = importlib.util.spec_from_file_location("sv_auto", os.path.join(ROOT, "sv-auto.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def data_path():
+    """tests/data 下的文件路径"""
+    return lambda *parts: os.path.join(DATA_DIR, *parts)
+
+
+@pytest.fixture(scope="session")
+def repo_path():
+    """仓库根目录下的文件路径（实录截图等资源）"""
+    return lambda *parts: os.path.join(ROOT, *parts)
+
+
+class FakeDeviceSocket:
+    """
+    本地TCP服务端，代替 adb forward 出来的 minicap/minitouch 端口
+    接受一个连接后依次发送 chunks（模拟分段到达），再记录客户端写入的数据直到连接关闭
+    """
+
+    def __init__(self, chunks, keep_open=True):
+        self.chunks = chunks
+        self.keep_open = keep_open
+        self.received = bytearray()
+        self._server = socket.create_server(("127.0.0.1", 0))
+        self.port = self._server.getsockname()[1]
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        conn, _ = self._server.accept()
+        with conn:
+            for chunk in self.chunks:
+                conn.sendall(chunk)
+                time.sleep(0.01)
+            if self.keep_open:
+                conn.settimeout(0.1)
+                while not self._done.is_set():
+                    try:
+                        data = conn.recv(4096)
+                    except socket.timeout:
+                        continue
+                    if not data:
+                        break
+                    self.received += data
+
+    def close(self):
+        self._done.set()
+        self._thread.join(timeout=2)
+        self._server.close()
+
+
+@pytest.fixture
+def fake_device_socket():
+    """fake_device_socket(chunks, keep_open=True) -> FakeDeviceSocket，测试结束时关闭"""
+    servers = []
+
+    def start(chunks, keep_open=True):
+        servers.append(FakeDeviceSocket(chunks, keep_open))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
@@ -0,0 +1,69 @@
+"""
+手牌费用数字识别测试
+用仓库里的费用模板 templates_cost/cost_N.png 拼出费用区域：单个数字、两位数、被区域边缘截掉一部分的数字
+"""
+import numpy as np
+import pytest
+
+# 换牌界面费用区域的大小（与 HAND_COST_REGIONS 相同量级）
+REGION_SIZE = (37, 39)
+
+
+@pytest.fixture(scope="module")
+def glyphs(sv, repo_path):
+    return {str(cost): sv.load_template(repo_path("templates_cost"), f"cost_{cost}.png") for cost in range(1, 6)}
+
+
+@pytest.fixture(scope="module")
+def recognizer(sv, glyphs):
+    return sv.DigitRecognizer(list(glyphs.items()), sv.COST_DIGIT_CELL, 0.8)
+
+
+def compose(glyphs, labels, size=REGION_SIZE, gap=0):
+    """把若干字形水平居中排进一个背景色的区域，放不下的部分被区域边缘截掉"""
+    width, height = size
+    background = int(np.median(glyphs["1"]))
+    region = np.full((height, width), background, dtype=np.uint8)
+    total = sum(glyphs[label].shape[1] for label in labels) + gap * (len(labels) - 1)
+    x = (width - total) // 2
+    for label in labels:
+        glyph = glyphs[label]
+        h, w = glyph.shape
+        y = (height - h) // 2
+        left, right = max(x, 0), min(x + w, width)
+        region[y:y + h, left:right] = glyph[:, left - x:right - x]
+        x += w + gap
+    return region
+
+
+def test_single_digits(recognizer, glyphs):
+    results = recognizer.predict([compose(glyphs, [label]) for label in glyphs])
+    assert [label for label, _ in results] == list(glyphs)
+    assert all(confidence >= 0.8 for _, confidence in results)
+
+
+@pytest.mark.parametrize("first", "12345")
+def test_two_digits_are_not_read_as_one(recognizer, glyphs, first):
+    crops = [compose(glyphs, [first, second]) for second in "12345"]
+    for second, (label, _) in zip("12345", recognizer.predict(crops)):
+        # 两位数要么完整读出，要么判为无法识别，不能只读出其中一位
+        assert label in (first + second, None)
+
+
+def test_clipped_neighbour_rejects_region(recognizer, glyphs):
+    # 区域右边缘把第二个字形截掉一半
+    first, second = glyphs["3"], glyphs["2"]
+    region = compose(glyphs, ["3", "2"], size=(first.shape[1] + second.shape[1] + 6, REGION_SIZE[1]))
+    region = region[:, :3 + first.shape[1] + second.shape[1] // 2]
+    label, _ = recognizer.predict([region])[0]
+    assert label is None
+
+
+def test_multi_digit_cost_counts_as_six(sv, recognizer, glyphs, monkeypatch):
+    monkeypatch.setattr(sv, "digit_recognizer", recognizer)
+    frame = np.zeros((60, 2 * REGION_SIZE[0]), dtype=np.uint8)
+    frame[:REGION_SIZE[1], :REGION_SIZE[0]] = compose(glyphs, ["3"])
+    frame[:REGION_SIZE[1], REGION_SIZE[0]:] = compose(glyphs, ["1", "2"])
+    regions = [(0, 0, REGION_SIZE[0], REGION_SIZE[1]), (REGION_SIZE[0], 0, 2 * REGION_SIZE[0], REGION_SIZE[1])]
+    costs = [cost for cost, _ in sv.detect_hand_costs(sv.FrameContext(np.dstack([frame] * 3)), {}, regions)]
+    assert costs == [3, 6]
@@ -0,0 +1,77 @@
+"""
+进化点读取测试
+国际服覆盖资源/extra_templates/screenshot.png 是实录的对战画面，进化点和超进化点都还在倒计时锁定中（格子是暗的）
+点亮和用掉的状态在实录帧上把格子调亮/恢复得到
+"""
+import cv2
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def locked_pixels(repo_path):
+    pixels = cv2.imread(repo_path("国际服覆盖资源", "extra_templates", "screenshot.png"))
+    assert pixels is not None
+    return pixels
+
+
+def with_pips(sv, pixels, names, delta):
+    """把指定进化点格子的亮度整体加上 delta"""
+    pixels = pixels.copy()
+    for name in names:
+        for x1, y1, x2, y2 in sv.EVOLUTION_POINT_PIPS[name]:
+            region = pixels[y1:y2, x1:x2].astype(np.int16) + delta
+            pixels[y1:y2, x1:x2] = np.clip(region, 0, 255).astype(np.uint8)
+    return pixels
+
+
+def test_locked_pips_never_read_as_spent(sv, locked_pixels):
+    baseline = sv.capture_evolution_point_baseline(sv.FrameContext(locked_pixels))
+    frame = sv.FrameContext(locked_pixels)
+    sv.update_evolution_point_baseline(frame, baseline)
+    assert sv.read_evolution_points(frame, baseline) == {'evolution': 2, 'super_evolution': 2}
+
+
+def test_spent_pips_read_after_unlock(sv, locked_pixels):
+    baseline = sv.capture_evolution_point_baseline(sv.FrameContext(locked_pixels))
+
+    # 进化解锁：进化点格子点亮
+    lit = sv.FrameContext(with_pips(sv, locked_pixels, ['evolution'], 60))
+    sv.update_evolution_point_baseline(lit, baseline)
+    assert sv.read_evolution_points(lit, baseline) == {'evolution': 2, 'super_evolution': 2}
+
+    # 两个进化点都用掉后格子变回暗的，超进化点仍锁定
+    spent = sv.FrameContext(locked_pixels)
+    sv.update_evolution_point_baseline(spent, baseline)
+    assert sv.read_evolution_points(spent, baseline) == {'evolution': 0, 'super_evolution': 2}
+
+
+def test_frame_dimming_is_compensated(sv, locked_pixels):
+    baseline = sv.capture_evolution_point_baseline(sv.FrameContext(locked_pixels))
+    sv.update_evolution_point_baseline(sv.FrameContext(with_pips(sv, locked_pixels, ['evolution'], 60)), baseline)
+
+    # 整帧被遮罩压暗时点亮的格子不应被判为已用掉
+    dimmed = with_pips(sv, locked_pixels, ['evolution'], 60).astype(np.int16) - 30
+    frame = sv.FrameContext(np.clip(dimmed, 0, 255).astype(np.uint8))
+    assert sv.read_evolution_points(frame, baseline)['evolution'] == 2
+
+
+def test_single_glowing_frame_does_not_raise_baseline(sv, locked_pixels):
+    baseline = sv.capture_evolution_point_baseline(sv.FrameContext(locked_pixels))
+    sv.update_evolution_point_baseline(sv.FrameContext(with_pips(sv, locked_pixels, ['evolution'], 60)), baseline)
+
+    # 某个回合开始时正好有进化光效，格子比平时亮得多
+    glowing = sv.FrameContext(with_pips(sv, locked_pixels, ['evolution'], 140))
+    sv.update_evolution_point_baseline(glowing, baseline)
+    assert sv.read_evolution_points(glowing, baseline)['evolution'] == 2
+
+    # 之后正常点亮的帧仍读作未用掉
+    for _ in range(3):
+        lit = sv.FrameContext(with_pips(sv, locked_pixels, ['evolution'], 60))
+        sv.update_evolution_point_baseline(lit, baseline)
+        assert sv.read_evolution_points(lit, baseline)['evolution'] == 2
+
+    # 真正用掉后仍能读出来
+    spent = sv.FrameContext(locked_pixels)
+    sv.update_evolution_point_baseline(spent, baseline)
+    assert sv.read_evolution_points(spent, baseline)['evolution'] == 0
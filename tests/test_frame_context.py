@@ -0,0 +1,56 @@
+"""
+FrameContext 缓冲区复用测试
+帧存活期间它的派生图像不能被之后的帧覆盖，帧被释放后缓冲区才回到缓冲池
+"""
+import gc
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def empty_pool(sv, monkeypatch):
+    monkeypatch.setattr(sv.FrameContext, "_buffer_pool", {})
+
+
+def frame(sv, value, size=(36, 64)):
+    return sv.FrameContext(np.full(size + (3,), value, dtype=np.uint8), 'RGB')
+
+
+def test_live_frames_never_share_buffers(sv):
+    frames = [frame(sv, value) for value in (10, 20, 30, 40, 50, 60)]
+    grays = [f.gray for f in frames]
+    bgrs = [f.bgr for f in frames]
+    for i, (gray, bgr) in enumerate(zip(grays, bgrs)):
+        for other_gray, other_bgr in zip(grays[i + 1:], bgrs[i + 1:]):
+            assert not np.shares_memory(gray, other_gray)
+            assert not np.shares_memory(bgr, other_bgr)
+    assert [int(gray[0, 0]) for gray in grays] == [10, 20, 30, 40, 50, 60]
+
+
+def test_released_frame_buffer_is_reused(sv):
+    old = frame(sv, 10)
+    buffer = old.gray
+    del old
+    gc.collect()
+    new = frame(sv, 90)
+    assert np.shares_memory(new.gray, buffer)
+    assert int(new.gray[0, 0]) == 90
+
+
+def test_crops_stay_valid_while_frame_is_alive(sv):
+    old = frame(sv, 10)
+    crop = old.crop_gray((0, 0, 8, 8))
+    newer = [frame(sv, 200) for _ in range(8)]
+    for f in newer:
+        f.gray
+    assert int(crop.max()) == 10
+
+
+def test_pool_size_is_capped(sv):
+    frames = [frame(sv, value) for value in range(10)]
+    for f in frames:
+        f.gray
+    del frames, f
+    gc.collect()
+    assert len(sv.FrameContext._buffer_pool[('gray', (36, 64))]) == sv.FrameContext.MAX_POOLED_BUFFERS
@@ -0,0 +1,69 @@
+"""
+手牌费用识别测试
+在实录截图的四个费用区域里贴上费用模板（随机位置、亮度和噪声），
+拼图匹配的结果要与逐个区域匹配（原先的做法）一致，并读出贴上去的费用
+"""
+import cv2
+import numpy as np
+import pytest
+
+SCREENSHOT = ("国际服覆盖资源", "extra_templates", "screenshot.png")
+
+
+@pytest.fixture(scope="module")
+def templates_cost(sv, repo_path):
+    return {
+        f'cost_{cost}': sv.create_template_info(sv.load_template(repo_path("templates_cost"), f'cost_{cost}.png'), f"费用{cost}")
+        for cost in range(1, 6)
+    }
+
+
+def per_region_costs(frame, templates_cost, regions):
+    """逐个区域、逐个模板匹配原图和均衡图"""
+    detections = []
+    for region in regions:
+        crops = [frame.crop_gray(region), frame.equalized(region)]
+        best_cost, best_score, top_score = 6, -1.0, 0.0
+        for cost in range(1, 6):
+            info = templates_cost[f'cost_{cost}']
+            score = max(cv2.matchTemplate(crop, info['template'], cv2.TM_CCOEFF_NORMED).max() for crop in crops)
+            top_score = max(top_score, score)
+            if score >= info['threshold'] and score > best_score:
+                best_cost, best_score = cost, score
+        detections.append((best_cost, best_score if best_cost != 6 else top_score))
+    return detections
+
+
+def mulligan_frames(sv, repo_path, templates_cost, count=40, seed=7):
+    """[(帧, 贴上的费用列表)]"""
+    rng = np.random.default_rng(seed)
+    background = cv2.imread(repo_path(*SCREENSHOT))
+    frames = []
+    for _ in range(count):
+        pixels = background.copy()
+        costs = []
+        for x1, y1, x2, y2 in sv.HAND_COST_REGIONS:
+            cost = int(rng.integers(1, 7))
+            costs.append(cost)
+            if cost == 6:
+                continue
+            glyph = templates_cost[f'cost_{cost}']['template'].astype(np.float32)
+            h, w = glyph.shape
+            x = x1 + int(rng.integers(0, x2 - x1 - w + 1))
+            y = y1 + int(rng.integers(0, y2 - y1 - h + 1))
+            glyph = glyph * rng.uniform(0.8, 1.2) + rng.normal(0, 4, glyph.shape)
+            pixels[y:y + h, x:x + w] = np.clip(glyph, 0, 255).astype(np.uint8)[..., None]
+        frames.append((pixels, costs))
+    return frames
+
+
+@pytest.mark.parametrize("use_fft", [False, True])
+def test_mosaic_matches_per_region(sv, repo_path, templates_cost, monkeypatch, use_fft):
+    monkeypatch.setattr(sv, "digit_recognizer", None)
+    monkeypatch.setattr(sv, "fft_matcher", sv.FFTMatcher() if use_fft else None)
+    for pixels, costs in mulligan_frames(sv, repo_path, templates_cost):
+        detections = sv.detect_hand_costs(sv.FrameContext(pixels), templates_cost)
+        expected = per_region_costs(sv.FrameContext(pixels), templates_cost, sv.HAND_COST_REGIONS)
+        assert [cost for cost, _ in detections] == [cost for cost, _ in expected]
+        assert [score for _, score in detections] == pytest.approx([score for _, score in expected], abs=1e-3)
+        assert [cost for cost, _ in detections] == costs
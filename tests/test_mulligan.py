@@ -0,0 +1,84 @@
+"""
+换牌策略表测试
+data/mulligan_golden.json 由引入策略表之前的 _check_3/4/5_cost_strategy（经 _determine_cards_to_replace）
+对全部 1296 种 1-6费+ 手牌生成，策略函数或策略表之后的改动只要改变了任何一手牌的换牌结果都会被发现
+"""
+import itertools
+import json
+import logging
+import threading
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def golden(data_path):
+    with open(data_path("mulligan_golden.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def tables(sv):
+    return sv.compile_mulligan_strategies()
+
+
+@pytest.mark.parametrize("strategy", ["3费档次", "4费档次", "5费档次"])
+def test_compiled_tables_match_golden(tables, golden, strategy):
+    expected = golden[strategy]
+    assert len(tables[strategy]) == len(expected) == 6 ** 4
+    mismatches = [
+        (hand, list(tables[strategy][hand]), expected["".join(map(str, hand))])
+        for hand in itertools.product(range(1, 7), repeat=4)
+        if list(tables[strategy][hand]) != expected["".join(map(str, hand))]
+    ]
+    assert mismatches == []
+
+
+@pytest.mark.parametrize("strategy", ["3费档次", "4费档次", "5费档次"])
+def test_strategy_functions_match_golden(sv, golden, strategy, monkeypatch):
+    monkeypatch.setattr(sv.logger, "disabled", True)
+    for key, expected in golden[strategy].items():
+        assert sv._determine_cards_to_replace([int(c) for c in key], strategy) == expected, key
+
+
+def test_custom_strategy(sv, tables):
+    custom = sv.compile_mulligan_strategies({
+        "2费档次": {"keep": [[1, 2, 2, 3]], "fallback": "3费档次"},
+        "低费": {"replace_above": 3},
+    })
+    assert custom["2费档次"][(3, 2, 1, 2)] == ()
+    assert custom["2费档次"][(6, 6, 6, 6)] == tables["3费档次"][(6, 6, 6, 6)]
+    assert custom["低费"][(1, 4, 2, 6)] == (1, 3)
+
+
+@pytest.mark.parametrize("spec", [
+    {"keep": [1, 2, 2, 3]},
+    {"keep": [[1, 2, 3]]},
+    {"replace_above": "3"},
+    {"fallback": "不存在"},
+    {"fallback": ["3费档次"]},
+    "3费档次",
+])
+def test_invalid_custom_strategy_is_skipped(sv, spec):
+    assert "自定义" not in sv.compile_mulligan_strategies({"自定义": spec})
+
+
+def test_compiling_mutes_only_the_compiling_thread(sv, caplog):
+    logged = []
+
+    def decide(hand_costs):
+        sv.logger.info("策略内部日志")
+        if not logged:
+            # 编译期间其他线程的日志不能被吞掉
+            worker = threading.Thread(target=lambda: sv.logger.info("其他线程日志"))
+            worker.start()
+            worker.join()
+            logged.append(True)
+        return []
+
+    with caplog.at_level(logging.INFO):
+        sv.compile_mulligan_strategy(decide)
+        sv.logger.info("编译结束后的日志")
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages == ["其他线程日志", "编译结束后的日志"]
+    assert not sv.logger.filters
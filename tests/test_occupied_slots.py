@@ -0,0 +1,70 @@
+"""
+随从位占用检测测试
+国际服覆盖资源/extra_templates/screenshot.png 是实录的空场对战画面，作为基准；
+随从用护盾目录里的随从截图贴到随从位上得到，整帧压暗/调亮模拟遮罩和闪光
+"""
+import glob
+
+import cv2
+import numpy as np
+import pytest
+
+BOARDS = [[], [4], [0], [8], [3, 4], [2, 3, 4, 5, 6], [1, 2, 3, 4, 5, 6, 7], list(range(9))]
+
+
+@pytest.fixture(scope="module")
+def empty_board(repo_path):
+    pixels = cv2.imread(repo_path("国际服覆盖资源", "extra_templates", "screenshot.png"))
+    assert pixels is not None
+    return pixels
+
+
+@pytest.fixture(scope="module")
+def follower_images(repo_path):
+    images = [cv2.imread(path) for path in sorted(glob.glob(repo_path("shield", "*.png")))]
+    images = [image for image in images if image is not None and min(image.shape[:2]) >= 56]
+    assert images
+    return images
+
+
+def board(sv, empty_board, follower_images, slots, seed, gain=1.0):
+    """在空场上的指定随从位贴随从，再整体乘以 gain 并加噪声"""
+    rng = np.random.default_rng(seed)
+    pixels = empty_board.copy()
+    for slot in slots:
+        x, y = sv.follower_positions[slot]
+        follower = follower_images[rng.integers(len(follower_images))]
+        pixels[y - 44:y + 36, x - 30:x + 30] = cv2.resize(follower, (60, 80))
+    pixels = pixels.astype(np.float32) * gain + rng.normal(0, 3, pixels.shape)
+    return sv.FrameContext(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+@pytest.mark.parametrize("slots", BOARDS)
+@pytest.mark.parametrize("gain", [1.0, 0.6, 1.3])
+def test_detects_followers(sv, empty_board, follower_images, slots, gain):
+    baseline = sv.capture_slot_baseline(sv.FrameContext(empty_board))
+    for seed in range(5):
+        frame = board(sv, empty_board, follower_images, slots, seed, gain)
+        assert sv.detect_occupied_slots(frame, baseline) == slots
+
+
+def test_missing_baseline(sv, empty_board):
+    assert sv.detect_occupied_slots(sv.FrameContext(empty_board), None) is None
+
+
+def test_attacks_fall_back_to_all_slots_when_none_detected(sv, empty_board, monkeypatch):
+    drags = []
+
+    class RecordingBatch:
+        def drag(self, x, y, *args, **kwargs):
+            drags.append((x, y))
+
+        def submit(self, device):
+            pass
+
+    monkeypatch.setattr(sv, "GestureBatch", RecordingBatch)
+    monkeypatch.setattr(sv, "find_shield_targets", lambda frame, region: [])
+    monkeypatch.setattr(sv, "detect_occupied_slots", lambda frame, base_colors: [])
+    config = {"extra_drag_delay": 0, "attack_delay": 0}
+    sv.perform_follower_attacks(None, sv.FrameContext(empty_board), object(), config)
+    assert drags == sv.reversed_follower_positions
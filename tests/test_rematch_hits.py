@@ -0,0 +1,49 @@
+"""
+画面未变化时的检测结果复用测试
+国服模板目录的实录截图里有“敌方回合”按钮；复用时点击位置必须取自当前帧，按钮消失时要求完整匹配
+"""
+import cv2
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def recorded(sv, repo_path):
+    directory = repo_path("国服覆盖资源", "templates")
+    pixels = cv2.imread(repo_path("国服覆盖资源", "templates", "screenshot.png"))
+    templates = {key: info for key, info in sv.load_main_templates(directory).items() if key == 'enemy_round'}
+    return pixels, templates
+
+
+def sweep(sv, pixels, templates):
+    hits = []
+    matches = list(sv.record_hits(sv.match_templates(sv.FrameContext(pixels), list(templates.items())), hits))
+    return matches, hits
+
+
+def test_no_hits_are_reused_without_matching(sv, recorded):
+    pixels, _ = recorded
+    assert sv.rematch_hits(sv.FrameContext(pixels), []) == []
+
+
+def test_rematch_uses_current_coordinates(sv, recorded):
+    pixels, templates = recorded
+    _, hits = sweep(sv, pixels, templates)
+    assert [key for key, _, _, _ in hits] == ['enemy_round']
+
+    # 按钮在本帧中移动了几个像素（画面变化小于阈值），点击位置要跟着变
+    moved = np.roll(pixels, (6, -8), axis=(0, 1))
+    matches = sv.rematch_hits(sv.FrameContext(moved), hits)
+    (key, info, max_loc, max_val), = matches
+    assert key == 'enemy_round' and max_val >= info['threshold']
+    assert max_loc == (hits[0][2][0] - 8, hits[0][2][1] + 6)
+
+
+def test_vanished_hit_requires_full_sweep(sv, recorded):
+    pixels, templates = recorded
+    _, hits = sweep(sv, pixels, templates)
+    x, y = hits[0][2]
+    info = hits[0][1]
+    greyed = pixels.copy()
+    greyed[y:y + info['h'], x:x + info['w']] = 128
+    assert sv.rematch_hits(sv.FrameContext(greyed), hits) is None
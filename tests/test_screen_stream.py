@@ -0,0 +1,70 @@
+"""
+minicap 截图流测试
+本地socket按 minicap 协议发送头部和JPEG帧（分段到达），检查头部解析、只保留最新帧和解码结果
+"""
+import struct
+import time
+
+import cv2
+import numpy as np
+
+
+def minicap_banner(pid=4321, real=(720, 1280), virtual=(720, 1280), orientation=1, quirks=2):
+    body = struct.pack("<IIIIIBB", pid, *real, *virtual, orientation, quirks)
+    return bytes([1, len(body) + 2]) + body
+
+
+def minicap_frame(image):
+    data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+    return struct.pack("<I", len(data)) + data
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_banner_and_latest_frame(sv, fake_device_socket):
+    image = np.zeros((72, 128, 3), dtype=np.uint8)
+    cv2.rectangle(image, (20, 10), (60, 50), (0, 200, 255), -1)
+    first, second = minicap_frame(np.full_like(image, 40)), minicap_frame(image)
+    # 头部和帧都拆成小段发送，长度字段也会被拆开
+    server = fake_device_socket(split(minicap_banner(), 5) + [first[:2], first[2:]] + split(second, 1000))
+
+    stream = sv.ScreenStream(port=server.port)
+    stream.start()
+    try:
+        assert stream.banner == {
+            'version': 1, 'pid': 4321,
+            'real_width': 720, 'real_height': 1280,
+            'virtual_width': 720, 'virtual_height': 1280,
+            'orientation': 90, 'quirks': 2,
+        }
+        deadline = time.time() + 5
+        while stream.frame_count < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        assert stream.frame_count == 2
+
+        frame_id, data = stream.read_raw()
+        assert frame_id == 2 and bytes(data) == second[4:]
+        decoded = stream.read()
+        assert decoded.shape == image.shape
+        assert np.abs(decoded.astype(int) - image.astype(int)).mean() < 3
+        # 同一帧只解码一次
+        assert stream.read() is decoded
+    finally:
+        stream.stop()
+
+
+def test_connection_closed_stops_stream(sv, fake_device_socket):
+    server = fake_device_socket([minicap_banner(), struct.pack("<I", 1000), b"\xff" * 10], keep_open=False)
+    stream = sv.ScreenStream(port=server.port)
+    stream.start()
+    try:
+        deadline = time.time() + 5
+        while stream.alive and time.time() < deadline:
+            time.sleep(0.01)
+        assert not stream.alive
+        # 截断的帧不会被当作最新帧
+        assert stream.read_raw(timeout=0.1) == (0, None)
+    finally:
+        stream.stop()
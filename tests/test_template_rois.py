@@ -0,0 +1,44 @@
+"""
+主循环模板搜索区域测试
+两个服务器模板目录里的实录截图逐个模板全屏匹配，命中位置必须落在该模板的搜索区域内；
+没有实录截图的模板只检查搜索区域在画面内且放得下模板，位置放错时靠主循环的定期全屏匹配纠正
+"""
+import os
+
+import cv2
+
+SERVER_DIRS = ["国服覆盖资源", "国际服覆盖资源"]
+FRAME_SIZE = (1280, 720)
+
+
+def template_dirs(repo_path):
+    return [repo_path(server, "templates") for server in SERVER_DIRS]
+
+
+def test_recorded_hits_lie_inside_roi(sv, repo_path):
+    checked = 0
+    for directory in template_dirs(repo_path):
+        frame = sv.FrameContext(cv2.imread(os.path.join(directory, "screenshot.png")))
+        for key, info in sv.load_main_templates(directory).items():
+            if info is None:
+                continue
+            max_loc, max_val = sv.match_template(frame, info, full_frame=True)
+            if max_val < info['threshold'] or info['roi'] is None:
+                continue
+            x1, y1, x2, y2 = info['roi']
+            assert x1 <= max_loc[0] and max_loc[0] + info['w'] <= x2, (directory, key, max_loc)
+            assert y1 <= max_loc[1] and max_loc[1] + info['h'] <= y2, (directory, key, max_loc)
+            checked += 1
+    # 实录截图是对战画面，至少要覆盖到国服的“敌方回合”按钮
+    assert checked > 0
+
+
+def test_every_roi_fits_its_template(sv, repo_path):
+    width, height = FRAME_SIZE
+    for directory in template_dirs(repo_path):
+        for key, info in sv.load_main_templates(directory).items():
+            if info is None or info['roi'] is None:
+                continue
+            x1, y1, x2, y2 = info['roi']
+            assert 0 <= x1 < x2 <= width and 0 <= y1 < y2 <= height, key
+            assert x2 - x1 >= info['w'] and y2 - y1 >= info['h'], (directory, key)
@@ -0,0 +1,98 @@
+"""
+minitouch 触控通道测试
+本地socket按 minitouch 协议发送头部，检查头部解析和写入的命令流；
+MinitouchDevice 的坐标换算和命令生成用记录命令的假通道检查
+"""
+import time
+
+import pytest
+
+BANNER = [b"v 1\n^ 10 10", b"79 1919 2048\n", b"$ 5678\n"]
+
+
+class RecordingTouch:
+    """记录命令的假触控通道（竖屏自然方向 1080x1920）"""
+
+    def __init__(self, fail=False):
+        self.banner = {'max_x': 1079, 'max_y': 1919, 'max_pressure': 2048}
+        self.fail = fail
+        self.commands = []
+        self.stopped = False
+
+    def send(self, commands):
+        if self.fail:
+            raise ConnectionError("broken pipe")
+        self.commands += commands
+
+    def stop(self):
+        self.stopped = True
+
+
+class RecordingU2:
+    def __init__(self):
+        self.calls = []
+
+    def click(self, x, y):
+        self.calls.append(('click', x, y))
+
+    def swipe_points(self, points, duration):
+        self.calls.append(('swipe_points', points, duration))
+
+
+def test_banner_and_send(sv, fake_device_socket):
+    server = fake_device_socket(BANNER)
+    stream = sv.TouchStream(port=server.port)
+    stream.start()
+    try:
+        assert stream.banner == {'version': 1, 'max_contacts': 10, 'max_x': 1079, 'max_y': 1919,
+                                 'max_pressure': 2048, 'pid': 5678}
+        stream.send(["d 0 10 20 50\n", "c\n", "u 0\n", "c\n"])
+        assert stream.command_count == 4
+    finally:
+        stream.stop()
+    deadline = time.time() + 2
+    while len(server.received) < 24 and time.time() < deadline:
+        time.sleep(0.01)
+    assert bytes(server.received) == b"d 0 10 20 50\nc\nu 0\nc\n"
+
+
+def test_banner_connection_closed(sv, fake_device_socket):
+    server = fake_device_socket([b"v 1\n"], keep_open=False)
+    stream = sv.TouchStream(port=server.port)
+    with pytest.raises(ConnectionError):
+        stream.start()
+    stream.stop()
+
+
+@pytest.mark.parametrize("rotation, point, expected", [
+    (0, (640, 360), (539, 959)),
+    (0, (1280, 0), (1079, 0)),
+    (90, (0, 0), (1079, 0)),
+    (90, (1280, 720), (0, 1919)),
+    (270, (0, 0), (0, 1919)),
+    (180, (0, 0), (1079, 1919)),
+])
+def test_point_rotation(sv, rotation, point, expected):
+    device = sv.MinitouchDevice(RecordingU2(), RecordingTouch(), (1280, 720), rotation)
+    assert device._point(*point) == expected
+
+
+def test_click_and_swipe_commands(sv):
+    touch = RecordingTouch()
+    device = sv.MinitouchDevice(RecordingU2(), touch, (1280, 720), 90)
+    device.click(0, 0)
+    assert touch.commands == ["d 0 1079 0 1024\n", "c\n", "w 20\n", "u 0\n", "c\n"]
+
+    touch.commands = []
+    device.swipe_points([(0, 0), (640, 360)], 0.01)
+    assert touch.commands == ["d 0 1079 0 1024\n", "c\n", "w 10\n", "m 0 539 959 1024\n", "c\n", "u 0\n", "c\n"]
+
+
+def test_broken_channel_falls_back_to_u2(sv):
+    u2 = RecordingU2()
+    touch = RecordingTouch(fail=True)
+    device = sv.MinitouchDevice(u2, touch, (1280, 720), 90)
+    device.click(100, 200)
+    device.click(300, 400)
+    assert touch.stopped and device.touch_stream is None
+    assert u2.calls == [('click', 100, 200), ('click', 300, 400)]